@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from src.fixed_boundary import FixedBoundarySolver, boundary_loop, circle_boundary
+from src.lscm import lscm
+from src.arap import arap_parameterization
+from src.distortion import distortion_energies
+
+METHODS = ("tutte", "meanvalue", "lscm", "arap")
+
+# Maximum RMS distance to the stored UVs after similarity alignment, relative to the
+# RMS radius of the stored UVs. The stored ARAP results were computed with libigl's
+# solver and its own stopping criterion, so only a loose match is expected.
+UV_TOLERANCES = dict(tutte=1e-4, meanvalue=1e-4, lscm=1e-4, arap=0.25)
+
+# Energy each method minimizes. Its median may not be worse than the one of the stored
+# UVs by more than the distortion tolerance (the mean is dominated by a few degenerate
+# triangles of halfbunny).
+TARGET_ENERGIES = dict(tutte="conformal", meanvalue="conformal", lscm="conformal", arap="isometric")
+
+def read_obj(path):
+    """ Read the vertices and triangles of an OBJ file
+
+    Returns:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    v_lines = re.findall(rb"^v +([^\n]*)", content, re.M)
+    vertices = np.fromstring(b" ".join(v_lines), dtype=np.float64, sep=" ").reshape(len(v_lines), -1)[:, :3]
+    # Keep the vertex index of every face corner ("v", "v/vt", "v//vn" or "v/vt/vn")
+    f_lines = re.findall(rb"^f +([^\n]*)", content, re.M)
+    corners = re.findall(rb"(-?\d+)\S*", b" ".join(f_lines))
+    faces = np.array(corners, dtype=np.int64).reshape(len(f_lines), 3)
+    return vertices, np.where(faces > 0, faces - 1, faces + len(vertices))
+
+def compute(method, vertices, faces, arap_iterations, arap_tolerance):
+    # Returns the UVs and the number of iterations (ARAP only)
+    if method in ("tutte", "meanvalue"):
+        solver = FixedBoundarySolver(vertices, faces, "uniform" if method == "tutte" else "meanvalue")
+        return solver.solve(circle_boundary(vertices, solver.pinned)), None
+    if method == "lscm":
+        return lscm(vertices, faces), None
+    uv, arap = arap_parameterization(vertices, faces, max_iterations=arap_iterations, tolerance=arap_tolerance)
+    return uv, len(arap.energies)
+
+def align(source, target):
+    """ Align the source points to the target points with the similarity transform
+    (rotation, uniform scale and translation) minimizing the squared distances """
+    source_centered = source - source.mean(axis=0)
+    target_centered = target - target.mean(axis=0)
+    U, S, Vt = np.linalg.svd(source_centered.T @ target_centered)
+    # Do not allow reflections: a mirrored map has the wrong orientation
+    d = np.sign(np.linalg.det(U @ Vt))
+    R = U @ np.diag([1, d]) @ Vt
+    scale = (S[0] + d * S[1]) / np.sum(source_centered ** 2)
+    return scale * source_centered @ R + target.mean(axis=0)
+
+def distortion_stats(vertices, faces, uv):
+    # Summary of the per-face distortion energies and singular values
+    energies = distortion_energies(vertices, faces, uv)
+    stats = {name: dict(
+        mean=float(np.mean(values)),
+        median=float(np.median(values)),
+        p95=float(np.percentile(values, 95)),
+        max=float(np.max(values)),
+    ) for name, values in energies.items() if name != "flipped"}
+    stats["flipped"] = int(np.sum(energies["flipped"]))
+    return stats
+
+def benchmark_mesh(name, args):
+    """ Recompute every method on a mesh and compare it to the stored solutions """
+    mesh_path = os.path.join(args.mesh_dir, f"{name}.obj")
+    if not os.path.exists(mesh_path):
+        print(f"{name}: {mesh_path} not found, skipping")
+        return dict(status="missing mesh", path=mesh_path)
+
+    vertices, faces = read_obj(mesh_path)
+    report = dict(status="ok", num_vertices=len(vertices), num_faces=len(faces),
+                  boundary_length=len(boundary_loop(faces)), methods={})
+    for method in args.methods:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            uv, iterations = compute(method, vertices, faces, args.arap_iterations, args.arap_tolerance)
+            times.append(time.perf_counter() - start)
+        result = dict(
+            time=min(times),
+            times=times,
+            iterations=iterations,
+            distortion=distortion_stats(vertices, faces, uv),
+            reference=None,
+            checks={},
+        )
+
+        reference_path = os.path.join(args.solution_dir, f"{name}_{method}.npy")
+        if os.path.exists(reference_path):
+            reference = np.load(reference_path)
+            if reference.shape != uv.shape:
+                result["reference"] = dict(path=reference_path, error=f"shape {reference.shape} != {uv.shape}")
+                result["checks"]["uv_match"] = False
+            else:
+                radius = np.sqrt(np.mean(np.sum((reference - reference.mean(axis=0)) ** 2, axis=1)))
+                rms = np.sqrt(np.mean(np.sum((align(uv, reference) - reference) ** 2, axis=1))) / radius
+                reference_distortion = distortion_stats(vertices, faces, reference)
+                energy = TARGET_ENERGIES[method]
+                result["reference"] = dict(path=reference_path, relative_rms=float(rms), distortion=reference_distortion)
+                result["checks"]["uv_match"] = bool(rms <= UV_TOLERANCES[method])
+                result["checks"][f"{energy}_distortion"] = bool(
+                    result["distortion"][energy]["median"] <=
+                    reference_distortion[energy]["median"] * (1 + args.distortion_tolerance))
+                result["checks"]["flipped"] = result["distortion"]["flipped"] <= reference_distortion["flipped"]
+        else:
+            result["reference"] = dict(path=reference_path, error="not found")
+
+        passed = all(result["checks"].values())
+        if not passed:
+            report["status"] = "failed"
+        message = f"{name} {method:>9}: {1000 * result['time']:8.1f} ms"
+        if iterations is not None:
+            message += f" ({iterations} iterations)"
+        if "relative_rms" in (result["reference"] or {}):
+            message += f", relative RMS to stored {result['reference']['relative_rms']:.2e}"
+        elif result["reference"] is not None:
+            message += f", stored UVs: {result['reference']['error']}"
+        message += f", median {TARGET_ENERGIES[method]} energy {result['distortion'][TARGET_ENERGIES[method]]['median']:.4g}"
+        print(message + ("" if passed else " FAILED"))
+        report["methods"][method] = result
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Parameterization benchmark",
+        description="Recompute the parameterizations of the exercise meshes, time them and "
+                    "compare them to the stored solutions.")
+    parser.add_argument("--meshes", nargs="+", default=["halfbunny", "ogre"], help="Mesh names (without .obj)")
+    parser.add_argument("--methods", nargs="+", default=list(METHODS), choices=METHODS)
+    parser.add_argument("--mesh-dir", default=".", help="Directory of the OBJ files")
+    parser.add_argument("--solution-dir", default="solution", help="Directory of the stored .npy solutions")
+    parser.add_argument("--output", default=None, help="Optional path of a JSON report")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per method (the best is kept)")
+    parser.add_argument("--arap-iterations", type=int, default=100)
+    parser.add_argument("--arap-tolerance", type=float, default=1e-5)
+    parser.add_argument("--distortion-tolerance", type=float, default=0.05,
+                        help="Allowed relative increase of the median distortion over the stored UVs")
+    args = parser.parse_args()
+
+    report = dict(
+        config=vars(args),
+        meshes={name: benchmark_mesh(name, args) for name in args.meshes},
+    )
+    failed = any(mesh["status"] == "failed" for mesh in report["meshes"].values())
+    report["status"] = "failed" if failed else "ok"
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
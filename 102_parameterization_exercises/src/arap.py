@@ -0,0 +1,155 @@
+import time
+import numpy as np
+from .fixed_boundary import FixedBoundarySolver, boundary_loop, circle_boundary
+from .laplacian import corner_angles
+
+class ARAP:
+    """
+    As-rigid-as-possible parameterization (Liu et al. 2008) with a local-global solver.
+    The energy is the sum over the half-edges (i -> j) of every face f of
+
+        cot(a_ij) * |(u_j - u_i) - R_f (x_j - x_i)|^2
+
+    with x the flattened triangle (see `local_triangles()`), a_ij the angle opposite the
+    half-edge and R_f a rotation per face.
+        - Local step: with the UVs fixed, the best rotation of every face is the rotation
+          part of the 2 x 2 matrix S_f = sum cot(a_ij) (u_j - u_i)(x_j - x_i)^T. It is
+          computed for all faces at once in closed form.
+        - Global step: with the rotations fixed, the UVs solve L u = b with the cotangent
+          Laplacian L, which does not change between iterations. It is factored once
+          (see `FixedBoundarySolver`), so every iteration is a single back-substitution.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        pinned (int): vertex that keeps its initial UV, to remove the translation
+    """
+    def __init__(self, vertices, faces, pinned=None):
+        self.faces = faces
+        self.num_vertices = vertices.shape[0]
+        self.pinned = np.array([faces[0, 0] if pinned is None else pinned])
+
+        # Half-edge k goes from corner k to corner k+1, its opposite angle is at corner k+2
+        self.cotans = 1 / np.tan(np.roll(corner_angles(vertices, faces), -2, axis=1))
+        triangles = local_triangles(vertices, faces)
+        self.edges = np.roll(triangles, -1, axis=1) - triangles
+        self.solver = FixedBoundarySolver(vertices, faces, weights="cotan", pinned=self.pinned)
+
+        self.energies = []
+        self.iteration_times = []
+
+    def _uv_edges(self, uv):
+        # F x 3 x 2 half-edge vectors in UV space
+        face_uvs = uv[self.faces]
+        return np.roll(face_uvs, -1, axis=1) - face_uvs
+
+    def local_step(self, uv):
+        """ Compute the best rotation of every face for the given UVs
+
+        Returns:
+            rotations (np.ndarray): F x 2 x 2 array of rotation matrices
+        """
+        S = np.einsum("fk,fki,fkj->fij", self.cotans, self._uv_edges(uv), self.edges)
+        # The rotation closest to a 2 x 2 matrix (the U V^T of its SVD, without
+        # reflection) turns by the angle of the similarity part of the matrix
+        angle = np.arctan2(S[:, 1, 0] - S[:, 0, 1], S[:, 0, 0] + S[:, 1, 1])
+        cos, sin = np.cos(angle), np.sin(angle)
+        return np.stack((np.stack((cos, -sin), axis=-1), np.stack((sin, cos), axis=-1)), axis=1)
+
+    def global_step(self, uv, rotations):
+        """ Compute the UVs that best fit the rotated triangles
+
+        Returns:
+            uv (np.ndarray): V x 2 array of UV coordinates
+        """
+        rotated = self.cotans[..., None] * np.einsum("fij,fkj->fki", rotations, self.edges)
+        # The half-edge (i -> j) adds its rotated edge to b_j and subtracts it from b_i
+        ends = np.roll(self.faces, -1, axis=1).ravel()
+        starts = self.faces.ravel()
+        rhs = np.stack([
+            np.bincount(ends, rotated[..., d].ravel(), self.num_vertices) -
+            np.bincount(starts, rotated[..., d].ravel(), self.num_vertices)
+            for d in range(2)
+        ], axis=1)
+        return self.solver.solve(uv[self.pinned], rhs=rhs)
+
+    def energy(self, uv, rotations):
+        """ ARAP energy of the UVs for the given rotations """
+        residual = self._uv_edges(uv) - np.einsum("fij,fkj->fki", rotations, self.edges)
+        return np.sum(self.cotans * np.sum(residual ** 2, axis=-1))
+
+    def solve(self, initial_uv, max_iterations=100, tolerance=1e-5, verbose=False):
+        """ Run local-global iterations until the relative decrease of the energy is
+        below `tolerance`
+
+        The energy and the time of every iteration are stored in `energies` and
+        `iteration_times`.
+
+        Args:
+            initial_uv (np.ndarray): V x 2 array of initial UV coordinates
+            max_iterations (int): maximum number of iterations
+            tolerance (float): relative energy decrease at which to stop
+            verbose (bool): print the energy and time of every iteration
+
+        Returns:
+            uv (np.ndarray): V x 2 array of UV coordinates
+        """
+        uv = np.asarray(initial_uv, dtype=np.float64)
+        self.energies, self.iteration_times = [], []
+        for i in range(max_iterations):
+            start = time.perf_counter()
+            rotations = self.local_step(uv)
+            uv = self.global_step(uv, rotations)
+            energy = self.energy(uv, rotations)
+            self.iteration_times.append(time.perf_counter() - start)
+            self.energies.append(energy)
+            if verbose:
+                print(f"Iteration {i}: energy {energy:.6g} ({1000 * self.iteration_times[-1]:.1f} ms)")
+            if i > 0 and self.energies[-2] - energy <= tolerance * abs(self.energies[-2]):
+                break
+        return uv
+
+def local_triangles(vertices, faces):
+    """ Flatten every triangle isometrically into its own 2D frame, with the first vertex
+    at the origin and the first edge on the x axis
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+
+    Returns:
+        triangles (np.ndarray): F x 3 x 2 array of 2D triangle coordinates
+    """
+    triangles = vertices[faces]
+    e1 = triangles[:, 1] - triangles[:, 0]
+    e2 = triangles[:, 2] - triangles[:, 0]
+    length = np.linalg.norm(e1, axis=1)
+    basis1 = e1 / length[:, None]
+    normal = np.cross(e1, e2)
+    basis2 = np.cross(normal / np.linalg.norm(normal, axis=1, keepdims=True), basis1)
+    return np.stack((
+        np.zeros((len(faces), 2)),
+        np.stack((length, np.zeros(len(faces))), axis=1),
+        np.stack((np.einsum("ij,ij->i", e2, basis1), np.einsum("ij,ij->i", e2, basis2)), axis=1)
+    ), axis=1)
+
+def arap_parameterization(vertices, faces, max_iterations=100, tolerance=1e-5, verbose=False):
+    """ ARAP parameterization starting from the harmonic map with the boundary on a
+    circle (as in the notebook)
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        max_iterations (int): maximum number of local-global iterations
+        tolerance (float): relative energy decrease at which to stop
+        verbose (bool): print the energy and time of every iteration
+
+    Returns:
+        uv (np.ndarray): V x 2 array of UV coordinates
+        arap (ARAP): the solver, with the energies and times of the iterations
+    """
+    loop = boundary_loop(faces)
+    initial_uv = FixedBoundarySolver(vertices, faces, "cotan", pinned=loop).solve(circle_boundary(vertices, loop))
+    arap = ARAP(vertices, faces)
+    uv = arap.solve(initial_uv, max_iterations=max_iterations, tolerance=tolerance, verbose=verbose)
+    return uv, arap
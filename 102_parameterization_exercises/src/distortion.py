@@ -0,0 +1,47 @@
+import numpy as np
+from .arap import local_triangles
+
+def jacobians(vertices, faces, uv):
+    """ Jacobian of the map from every triangle (in its own 2D frame, see
+    `local_triangles()`) to the UV plane
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        uv (np.ndarray): V x 2 array of UV coordinates
+
+    Returns:
+        J (np.ndarray): F x 2 x 2 array of Jacobians
+    """
+    triangles = local_triangles(vertices, faces)
+    face_uvs = uv[faces]
+    X = np.stack((triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=2)
+    U = np.stack((face_uvs[:, 1] - face_uvs[:, 0], face_uvs[:, 2] - face_uvs[:, 0]), axis=2)
+    # X is upper triangular: [[x1, x2], [0, y2]]
+    X_inv = np.zeros_like(X)
+    X_inv[:, 0, 0] = 1 / X[:, 0, 0]
+    X_inv[:, 0, 1] = -X[:, 0, 1] / (X[:, 0, 0] * X[:, 1, 1])
+    X_inv[:, 1, 1] = 1 / X[:, 1, 1]
+    return U @ X_inv
+
+def distortion_energies(vertices, faces, uv):
+    """ Per-face distortion energies of notebook 101, from the singular values s1 >= s2
+    of the Jacobians
+
+    Returns:
+        energies (dict): F arrays "area" (s1 s2 + 1 / (s1 s2) - 2), "conformal"
+            ((s1 - s2)^2) and "isometric" (s1^2 + s2^2 + 1 / s1^2 + 1 / s2^2 - 4), the
+            singular values "s1" and "s2", and "flipped" (True where the map reverses
+            the orientation of the face)
+    """
+    J = jacobians(vertices, faces, uv)
+    S = np.linalg.svd(J, compute_uv=False)
+    s1, s2 = S[:, 0], S[:, 1]
+    return dict(
+        area=s1 * s2 + 1 / (s1 * s2) - 2,
+        conformal=(s1 - s2) ** 2,
+        isometric=s1 ** 2 + s2 ** 2 + 1 / s1 ** 2 + 1 / s2 ** 2 - 4,
+        s1=s1,
+        s2=s2,
+        flipped=np.linalg.det(J) < 0,
+    )
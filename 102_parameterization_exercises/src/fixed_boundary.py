@@ -0,0 +1,131 @@
+import numpy as np
+import scipy.sparse.linalg
+from .laplacian import laplacian
+
+def boundary_loop(faces):
+    """ Find the longest boundary loop of a triangle mesh
+
+    Boundary edges are the edges of a single face. They are followed in the direction of
+    their face, so the loop is counter-clockwise when the mesh faces are. Like libigl,
+    the loop starts at its lowest vertex index.
+
+    Args:
+        faces (np.ndarray): F x 3 integer array of face indices
+
+    Returns:
+        loop (np.ndarray): B array of boundary vertex indices in loop order
+    """
+    half_edges = np.stack((faces, np.roll(faces, -1, axis=1)), axis=-1).reshape(-1, 2)
+    num_vertices = faces.max() + 1
+    keys = half_edges[:, 0] * num_vertices + half_edges[:, 1]
+    reverse_keys = half_edges[:, 1] * num_vertices + half_edges[:, 0]
+    boundary = half_edges[~np.isin(keys, reverse_keys)]
+    if len(boundary) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    successor = dict(zip(boundary[:, 0].tolist(), boundary[:, 1].tolist()))
+    visited = set()
+    best = []
+    for start in boundary[:, 0].tolist():
+        if start in visited:
+            continue
+        loop = [start]
+        visited.add(start)
+        vertex = successor[start]
+        while vertex != start and vertex not in visited:
+            loop.append(vertex)
+            visited.add(vertex)
+            vertex = successor.get(vertex, start)
+        if len(loop) > len(best):
+            best = loop
+    best = np.array(best, dtype=np.int64)
+    return np.roll(best, -np.argmin(best))
+
+def _arc_length(vertices, loop):
+    # Normalized arc length in [0, 1) at every vertex of a closed loop
+    points = vertices[loop]
+    lengths = np.linalg.norm(np.roll(points, -1, axis=0) - points, axis=1)
+    return np.concatenate(([0], np.cumsum(lengths)[:-1])) / lengths.sum()
+
+def circle_boundary(vertices, loop):
+    """ Map a boundary loop to the unit circle, spacing the vertices by arc length
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        loop (np.ndarray): B array of boundary vertex indices in loop order
+
+    Returns:
+        positions (np.ndarray): B x 2 array of positions on the circle
+    """
+    angles = 2 * np.pi * _arc_length(vertices, loop)
+    return np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+def square_boundary(vertices, loop):
+    """ Map a boundary loop to the border of the unit square [0, 1]^2, spacing the
+    vertices by arc length
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        loop (np.ndarray): B array of boundary vertex indices in loop order
+
+    Returns:
+        positions (np.ndarray): B x 2 array of positions on the square
+    """
+    t = 4 * _arc_length(vertices, loop)
+    side, s = np.floor(t).astype(int), t - np.floor(t)
+    # Counter-clockwise from (0, 0): bottom, right, top and left sides
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float64)
+    return corners[side] + s[:, None] * (corners[(side + 1) % 4] - corners[side])
+
+class FixedBoundarySolver:
+    """
+    Solve the linear system L U = 0 for the free vertices of a mesh, given the
+    positions of the pinned vertices (Tutte, harmonic and mean value parameterizations).
+
+    The Laplacian is assembled and the block of the free vertices is factored once, so
+    every call to `solve()` only needs a sparse matrix product and a back-substitution.
+    Different boundary maps (see `circle_boundary()` and `square_boundary()`) or pinned
+    positions can thus be tried at almost no cost.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        weights (str): "uniform", "cotan" or "meanvalue" (see `edge_weights()`)
+        pinned (np.ndarray): P array of pinned vertex indices, by default the longest
+            boundary loop (see `boundary_loop()`)
+    """
+    def __init__(self, vertices, faces, weights="uniform", pinned=None):
+        self.num_vertices = vertices.shape[0]
+        self.pinned = boundary_loop(faces) if pinned is None else np.asarray(pinned, dtype=np.int64)
+        is_free = np.ones(self.num_vertices, dtype=bool)
+        is_free[self.pinned] = False
+        self.free = np.nonzero(is_free)[0]
+
+        L = laplacian(vertices, faces, weights).tocsr()
+        L_free = L[self.free]
+        self.L_pinned = L_free[:, self.pinned]
+        # The free block is symmetric (and positive definite for positive weights): a
+        # symmetric fill-reducing ordering without pivoting keeps the LU factors as
+        # sparse as a Cholesky factor
+        self.factorization = scipy.sparse.linalg.splu(
+            L_free[:, self.free].tocsc(), permc_spec="MMD_AT_PLUS_A",
+            diag_pivot_thresh=0, options=dict(SymmetricMode=True))
+
+    def solve(self, pinned_positions, rhs=None):
+        """ Solve for the positions of the free vertices
+
+        Args:
+            pinned_positions (np.ndarray): P x D array of positions of the pinned vertices
+            rhs (np.ndarray): optional V x D right hand side (0 for a harmonic map)
+
+        Returns:
+            positions (np.ndarray): V x D array of positions of all vertices
+        """
+        pinned_positions = np.asarray(pinned_positions, dtype=np.float64)
+        b = -(self.L_pinned @ pinned_positions)
+        if rhs is not None:
+            b += rhs[self.free]
+        positions = np.empty((self.num_vertices, pinned_positions.shape[1]))
+        positions[self.pinned] = pinned_positions
+        positions[self.free] = self.factorization.solve(b)
+        return positions
@@ -0,0 +1,85 @@
+import numpy as np
+import scipy.sparse
+
+def corner_angles(vertices, faces):
+    """ Compute the interior angle at every corner of every triangle
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+
+    Returns:
+        angles (np.ndarray): F x 3 array, angles[f, k] is the angle at faces[f, k]
+    """
+    triangles = vertices[faces]
+    # Edges leaving corner k towards the two other corners
+    e1 = np.roll(triangles, -1, axis=1) - triangles
+    e2 = np.roll(triangles, -2, axis=1) - triangles
+    cos = np.einsum("fkd,fkd->fk", e1, e2)
+    sin = np.linalg.norm(np.cross(e1, e2), axis=-1)
+    return np.arctan2(sin, cos)
+
+def edge_weights(vertices, faces, weights="uniform"):
+    """ Compute the weight of every edge of a triangle mesh in one vectorized pass
+
+    The weights are accumulated per half-edge (i -> j, the edge from faces[f, k] to
+    faces[f, k+1]) and summed over the one or two faces of every edge:
+        "uniform": 1 (Tutte embedding)
+        "cotan": cot of the angle opposite the half-edge (harmonic parameterization)
+        "meanvalue": tan(a/2) / |x_i - x_j|, with a the angle at the lower index vertex
+            of the edge (the symmetric mean value weights of notebook 101)
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        weights (str): "uniform", "cotan" or "meanvalue"
+
+    Returns:
+        edges (np.ndarray): E x 2 array of unique edges (i < j)
+        edge_weights (np.ndarray): E array of edge weights
+        face_count (np.ndarray): E array of the number of faces of every edge (1 on the
+            boundary)
+    """
+    num_vertices = vertices.shape[0]
+    half_edges = np.stack((faces, np.roll(faces, -1, axis=1)), axis=-1).reshape(-1, 2)
+    lo, hi = half_edges.min(axis=1), half_edges.max(axis=1)
+    keys, edge_ids, face_count = np.unique(lo * num_vertices + hi, return_inverse=True, return_counts=True)
+    edges = np.stack((keys // num_vertices, keys % num_vertices), axis=1)
+
+    if weights == "uniform":
+        return edges, np.ones(len(edges)), face_count
+
+    angles = corner_angles(vertices, faces)
+    if weights == "cotan":
+        # The angle opposite the half-edge k -> k+1 is at corner k+2
+        half_edge_weights = 1 / np.tan(np.roll(angles, -2, axis=1)).ravel()
+    elif weights == "meanvalue":
+        start_is_lo = (half_edges[:, 0] == lo)
+        lo_angles = np.where(start_is_lo, angles.ravel(), np.roll(angles, -1, axis=1).ravel())
+        lengths = np.linalg.norm(vertices[half_edges[:, 1]] - vertices[half_edges[:, 0]], axis=1)
+        half_edge_weights = np.tan(lo_angles / 2) / lengths
+    else:
+        raise ValueError(f"Unknown weights {weights}, expected 'uniform', 'cotan' or 'meanvalue'")
+    return edges, np.bincount(edge_ids, half_edge_weights, len(edges)), face_count
+
+def laplacian(vertices, faces, weights="uniform"):
+    """ Assemble the sparse Laplacian L = D - W from the edge weights
+
+    Off-diagonal entries are the negative edge weights and every diagonal entry is the
+    sum of the weights of its row, so L is symmetric and its rows sum to 0.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        weights (str): "uniform", "cotan" or "meanvalue" (see `edge_weights()`)
+
+    Returns:
+        L (scipy.sparse.csr_matrix): V x V Laplacian matrix
+    """
+    num_vertices = vertices.shape[0]
+    edges, w, _ = edge_weights(vertices, faces, weights)
+    rows = np.concatenate((edges[:, 0], edges[:, 1], edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0], edges[:, 0], edges[:, 1]))
+    values = np.concatenate((-w, -w, w, w))
+    # Duplicate (i, i) entries are summed when converting from COO
+    return scipy.sparse.coo_matrix((values, (rows, cols)), shape=(num_vertices, num_vertices)).tocsr()
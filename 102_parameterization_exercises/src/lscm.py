@@ -0,0 +1,60 @@
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+from .arap import local_triangles
+from .fixed_boundary import boundary_loop
+
+def lscm(vertices, faces, pinned=None, pinned_positions=None):
+    """ Least squares conformal map (Levy et al. 2002)
+
+    Every triangle is flattened into its own frame with complex coordinates z_k. The map
+    to the complex UVs U_k is conformal on the triangle if sum_k W_k U_k = 0 with
+    W_k = z_{k+2} - z_{k+1}. The residuals, weighted by the inverse square root of the
+    triangle area, are minimized in the least squares sense for fixed pinned vertices,
+    through the sparse normal equations.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex positions
+        faces (np.ndarray): F x 3 integer array of face indices
+        pinned (np.ndarray): P >= 2 array of pinned vertices, by default the first vertex
+            of the boundary loop and the one halfway along it (as in the notebook)
+        pinned_positions (np.ndarray): P x 2 array of pinned UVs, by default (0, 0) and
+            (1, 1)
+
+    Returns:
+        uv (np.ndarray): V x 2 array of UV coordinates
+    """
+    num_faces, num_vertices = faces.shape[0], vertices.shape[0]
+    if pinned is None:
+        loop = boundary_loop(faces)
+        pinned = np.array([loop[0], loop[len(loop) // 2]])
+        pinned_positions = np.array([[0, 0], [1, 1]], dtype=np.float64)
+
+    triangles = local_triangles(vertices, faces)
+    z = triangles[..., 0] + 1j * triangles[..., 1]
+    double_area = (z[:, 1] * z[:, 2].conj()).imag
+    w = (np.roll(z, -2, axis=1) - np.roll(z, -1, axis=1)) / np.sqrt(np.abs(double_area))[:, None]
+
+    # Real form of the complex residual: (a + ib)(u + iv) = (au - bv) + i(bu + av)
+    rows = np.repeat(np.arange(num_faces), 3)
+    cols = faces.ravel()
+    a, b = w.real.ravel(), w.imag.ravel()
+    matrix = scipy.sparse.coo_matrix((
+        np.concatenate((a, -b, b, a)),
+        (np.concatenate((rows, rows, rows + num_faces, rows + num_faces)),
+         np.concatenate((cols, cols + num_vertices, cols, cols + num_vertices)))
+    ), shape=(2 * num_faces, 2 * num_vertices)).tocsc()
+
+    pinned = np.concatenate((pinned, pinned + num_vertices))
+    pinned_values = np.concatenate((pinned_positions[:, 0], pinned_positions[:, 1]))
+    free = np.ones(2 * num_vertices, dtype=bool)
+    free[pinned] = False
+    free_matrix = matrix[:, free]
+    factorization = scipy.sparse.linalg.splu(
+        (free_matrix.T @ free_matrix).tocsc(), permc_spec="MMD_AT_PLUS_A",
+        diag_pivot_thresh=0, options=dict(SymmetricMode=True))
+
+    solution = np.empty(2 * num_vertices)
+    solution[pinned] = pinned_values
+    solution[free] = factorization.solve(-(free_matrix.T @ (matrix[:, pinned] @ pinned_values)))
+    return np.stack((solution[:num_vertices], solution[num_vertices:]), axis=1)
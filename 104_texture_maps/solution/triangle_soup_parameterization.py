@@ -1,8 +1,9 @@
 import torch
-from src.trivial_parameterization import trivial_parameterization
+from src.trivial_parameterization import fused_trivial_parameterization
+from src.shelf_packing import pack_triangles_shelf
 from .pack_triangles import pack_triangles
 
-def triangle_soup_parameterization(mesh):
+def triangle_soup_parameterization(mesh, packing="grid"):
     """
     This function compute the "trivial" triangle soup parameterization.
     Input: mesh object containing vertices and faces
@@ -27,6 +28,9 @@ def triangle_soup_parameterization(mesh):
     
     Args:
         mesh (Mesh): mesh object containing vertices and faces
+        packing (str): either "grid" (one grid cell per triangle, see `pack_triangles()`)
+            or "shelf" (pairs of triangles packed on shelves, see `pack_triangles_shelf()`,
+            which also returns the fraction of the UV square that is used)
     
     Returns:
         vt (torch.tensor): num_faces*3 x 2 tensor containing the UV coordinates of each
@@ -39,11 +43,15 @@ def triangle_soup_parameterization(mesh):
     # For example: new_tensor = torch.tensor([1, 2, 3]).to(device)
     device = mesh.vertices.device
 
-    # Map all triangles to the plane independently (use `trivial_parameterization()`)
-    local_triangles = trivial_parameterization(mesh.vertices[mesh.faces])[0]
+    # Map all triangles to the plane independently (`fused_trivial_parameterization()`
+    # computes the same coordinates as `trivial_parameterization()` without the bases)
+    local_triangles = fused_trivial_parameterization(mesh.vertices[mesh.faces])
     
     # Pack triangles into a unit sqaure
-    packed_triangles = pack_triangles(local_triangles)
+    if packing == "shelf":
+        packed_triangles, _ = pack_triangles_shelf(local_triangles)
+    else:
+        packed_triangles = pack_triangles(local_triangles)
 
     # Construct the vt and ft tensors using the packed triangles
     # Hint: see torch.arange() for creating the ft tensor
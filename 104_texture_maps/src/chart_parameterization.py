@@ -0,0 +1,314 @@
+import math
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
+import torch
+from src.shelf_packing import pack_rectangles
+from src.trivial_parameterization import fused_trivial_parameterization_np
+
+def chart_parameterization(mesh, max_angle=45.0, padding=0.005):
+    """
+    Compute a parameterization made of charts instead of single triangles:
+        (1) Faces are grouped into charts by region growing on the face normals
+            (see `grow_charts()`)
+        (2) Every chart is flattened with least squares conformal maps (LSCM, see
+            `flatten_charts()`), all charts in one sparse solve
+        (3) The charts are scaled to their surface area and packed into the unit square
+            (see `pack_charts()`)
+
+    Vertices inside a chart share their UV coordinates, so vt has one row per chart
+    vertex instead of one per face corner.
+
+    Args:
+        mesh (Mesh): mesh object containing vertices and faces
+        max_angle (float): maximum angle in degrees between the normal of a face and the
+            average normal of its chart
+        padding (float): space between the charts, as a fraction of the UV square
+
+    Returns:
+        vt (torch.tensor): U x 2 tensor containing the UV coordinates of each chart vertex
+        ft (torch.tensor): num_faces x 3 tensor containing the indices into vt for the
+                           vertices of each face
+        utilization (float): fraction of the unit square covered by triangles
+    """
+    is_torch = isinstance(mesh.vertices, torch.Tensor)
+    vertices = mesh.vertices.cpu().numpy() if is_torch else mesh.vertices
+    faces = mesh.faces.cpu().numpy() if is_torch else mesh.faces
+    vertices, faces = vertices.astype(np.float64), faces.astype(np.int64)
+
+    charts = grow_charts(vertices, faces, max_angle=max_angle)
+    vt, ft, vt_charts = flatten_charts(vertices, faces, charts)
+    vt, utilization = pack_charts(vertices, faces, vt, ft, vt_charts, padding=padding)
+
+    if is_torch:
+        device = mesh.vertices.device
+        vt = torch.from_numpy(vt).float().to(device)
+        ft = torch.from_numpy(ft).to(device)
+    return vt, ft, utilization
+
+def face_adjacency(faces):
+    """
+    Find the pairs of faces sharing an edge. Edges with more than two faces
+    (non-manifold edges) connect the faces in the order in which they are found.
+
+    Args:
+        faces (np.ndarray): F x 3 array of triangle vertex indices
+
+    Returns:
+        pairs (np.ndarray): E x 2 array of adjacent face indices
+    """
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edge_faces = np.repeat(np.arange(faces.shape[0]), 3)
+    keys = edges[:, 0] * (faces.max() + 1) + edges[:, 1]
+    order = np.argsort(keys, kind="stable")
+    keys, edge_faces = keys[order], edge_faces[order]
+    shared = keys[1:] == keys[:-1]
+    return np.stack((edge_faces[:-1][shared], edge_faces[1:][shared]), axis=1)
+
+def grow_charts(vertices, faces, max_angle=45.0):
+    """
+    Group faces into charts by region growing. Starting from the largest face not yet
+    in a chart, neighboring faces are added as long as their normal is within
+    `max_angle` of the area weighted average normal of the chart. Such charts are
+    nearly flat and connected, so they can be flattened with little distortion.
+
+    A chart can still enclose other charts (e.g. a ring around a bump). LSCM folds such
+    charts over themselves, so charts that are not topological disks are cut in half
+    along their longest axis until all charts are disks.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex coordinates
+        faces (np.ndarray): F x 3 array of triangle vertex indices
+        max_angle (float): maximum angle in degrees between a face normal and the chart
+            normal
+
+    Returns:
+        charts (np.ndarray): F array of the chart index of every face
+    """
+    num_faces = faces.shape[0]
+    triangles = vertices[faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    unit_normals = (normals / np.maximum(areas, 1e-30)[:, None]).tolist()
+    normals = normals.tolist()
+
+    pairs = face_adjacency(faces)
+    adjacency = scipy.sparse.coo_matrix(
+        (np.ones(2 * len(pairs)), (pairs.ravel(), pairs[:, ::-1].ravel())),
+        shape=(num_faces, num_faces)
+    ).tocsr()
+    indptr, neighbors = adjacency.indptr.tolist(), adjacency.indices.tolist()
+
+    # Growing is sequential, plain Python lists are much faster than NumPy here
+    min_cos = math.cos(math.radians(max_angle))
+    charts = [-1] * num_faces
+    num_charts = 0
+    for seed in np.argsort(-areas, kind="stable").tolist():
+        if charts[seed] >= 0:
+            continue
+        charts[seed] = num_charts
+        chart_normal = list(normals[seed])
+        stack = [seed]
+        while stack:
+            face = stack.pop()
+            norm = math.sqrt(sum(c * c for c in chart_normal)) or 1.0
+            for neighbor in neighbors[indptr[face]:indptr[face + 1]]:
+                if charts[neighbor] >= 0:
+                    continue
+                n = unit_normals[neighbor]
+                if (n[0] * chart_normal[0] + n[1] * chart_normal[1] + n[2] * chart_normal[2]) < min_cos * norm:
+                    continue
+                charts[neighbor] = num_charts
+                chart_normal = [c + d for c, d in zip(chart_normal, normals[neighbor])]
+                stack.append(neighbor)
+        num_charts += 1
+    charts = np.array(charts, dtype=np.int64)
+
+    centroids = vertices[faces].mean(axis=1)
+    while True:
+        non_disks = np.nonzero(_euler_characteristics(faces, charts) != 1)[0]
+        split = np.isin(charts, non_disks)
+        if not split.any():
+            return charts
+        # Cut at the median of the face centroids along the longest axis of every chart
+        split_faces = np.nonzero(split)[0]
+        split_charts = np.searchsorted(non_disks, charts[split_faces])
+        lo = np.full((len(non_disks), 3), np.inf)
+        hi = np.full((len(non_disks), 3), -np.inf)
+        np.minimum.at(lo, split_charts, centroids[split_faces])
+        np.maximum.at(hi, split_charts, centroids[split_faces])
+        axis = np.argmax(hi - lo, axis=1)[split_charts]
+        coords = centroids[split_faces, axis]
+        order = np.lexsort((coords, split_charts))
+        counts = np.bincount(split_charts, minlength=len(non_disks))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+        upper = rank >= counts[split_charts] // 2
+        charts[split_faces[upper]] += charts.max() + 1
+        # Both halves may fall apart into several pieces, every piece becomes a chart
+        same = charts[pairs[:, 0]] == charts[pairs[:, 1]]
+        graph = scipy.sparse.coo_matrix(
+            (np.ones(same.sum()), (pairs[same, 0], pairs[same, 1])), shape=(num_faces, num_faces))
+        charts = scipy.sparse.csgraph.connected_components(graph, directed=False)[1].astype(np.int64)
+
+def _euler_characteristics(faces, charts):
+    # V - E + F of every chart; 1 for topological disks
+    num_charts = charts.max() + 1
+    vertex_keys = np.unique(charts[:, None] * (faces.max() + 1) + faces)
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 3, 2), axis=2)
+    edge_keys = np.unique((
+        charts[:, None] * (faces.max() + 1) + edges[..., 0]) * (faces.max() + 1) + edges[..., 1])
+    num_vertices = np.bincount(vertex_keys // (faces.max() + 1), minlength=num_charts)
+    num_edges = np.bincount(edge_keys // (faces.max() + 1) ** 2, minlength=num_charts)
+    return num_vertices - num_edges + np.bincount(charts, minlength=num_charts)
+
+def flatten_charts(vertices, faces, charts):
+    """
+    Flatten all charts with least squares conformal maps (LSCM). Every triangle is
+    expressed in a local 2D frame with complex coordinates z_j; the map to UV
+    coordinates U_j is conformal on the triangle if sum_j W_j U_j = 0 with
+    W_j = z_{j+2} - z_{j+1}. The squared residuals weighted by the inverse triangle area
+    are minimized for all triangles at once, with two vertices of every chart pinned to
+    fix its position, rotation and scale. The charts are independent blocks of a single
+    sparse least squares problem, which is solved through its normal equations.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex coordinates
+        faces (np.ndarray): F x 3 array of triangle vertex indices
+        charts (np.ndarray): F array of the chart index of every face
+
+    Returns:
+        vt (np.ndarray): U x 2 array of UV coordinates of the chart vertices
+        ft (np.ndarray): F x 3 array of indices into vt
+        vt_charts (np.ndarray): U array of the chart of every chart vertex
+    """
+    num_faces, num_vertices = faces.shape[0], vertices.shape[0]
+    # One UV vertex per (chart, vertex) pair
+    keys, ft = np.unique(charts[:, None] * num_vertices + faces, return_inverse=True)
+    ft = ft.reshape(num_faces, 3)
+    vt_charts, vt_vertices = keys // num_vertices, keys % num_vertices
+    num_uvs = keys.shape[0]
+
+    # Local 2D coordinates of every triangle as complex numbers
+    local = fused_trivial_parameterization_np(vertices[faces])
+    z = local[..., 0] + 1j * local[..., 1]
+    double_area = np.maximum(local[:, 1, 0] * local[:, 2, 1], 1e-30)
+    w = (np.roll(z, -2, axis=1) - np.roll(z, -1, axis=1)) / np.sqrt(double_area)[:, None]
+
+    # Real form of the complex residual: (a + ib)(u + iv) = (au - bv) + i(bu + av)
+    rows = np.repeat(np.arange(num_faces), 3)
+    cols = ft.ravel()
+    a, b = w.real.ravel(), w.imag.ravel()
+    matrix = scipy.sparse.coo_matrix((
+        np.concatenate((a, -b, b, a)),
+        (np.concatenate((rows, rows, rows + num_faces, rows + num_faces)),
+         np.concatenate((cols, cols + num_uvs, cols, cols + num_uvs)))
+    ), shape=(2 * num_faces, 2 * num_uvs)).tocsc()
+
+    # Pin the two vertices of every chart that are furthest apart along the longest
+    # axis of the chart bounding box
+    num_charts = charts.max() + 1
+    points = vertices[vt_vertices]
+    lo = np.full((num_charts, 3), np.inf)
+    hi = np.full((num_charts, 3), -np.inf)
+    np.minimum.at(lo, vt_charts, points)
+    np.maximum.at(hi, vt_charts, points)
+    axis = np.argmax(hi - lo, axis=1)
+    order = np.lexsort((points[np.arange(num_uvs), axis[vt_charts]], vt_charts))
+    ends = np.cumsum(np.bincount(vt_charts, minlength=num_charts))
+    first, last = order[ends - np.bincount(vt_charts, minlength=num_charts)], order[ends - 1]
+    pinned = np.concatenate((first, last, first + num_uvs, last + num_uvs))
+    pinned_values = np.concatenate((
+        np.zeros(num_charts),
+        np.linalg.norm(points[last] - points[first], axis=1),
+        np.zeros(2 * num_charts)
+    ))
+
+    free = np.ones(2 * num_uvs, dtype=bool)
+    free[pinned] = False
+    free_matrix = matrix[:, free]
+    rhs = -free_matrix.T @ (matrix[:, pinned] @ pinned_values)
+    solution = np.empty(2 * num_uvs)
+    solution[pinned] = pinned_values
+    solution[free] = scipy.sparse.linalg.spsolve((free_matrix.T @ free_matrix).tocsc(), rhs)
+
+    vt = np.stack((solution[:num_uvs], solution[num_uvs:]), axis=1)
+    return vt, ft, vt_charts
+
+def pack_charts(vertices, faces, vt, ft, vt_charts, padding=0.005, num_angles=16):
+    """
+    Pack flattened charts into the unit square. Every chart is scaled so that its UV
+    area equals its surface area (all charts get the same texel density), rotated to
+    tighten its bounding box, and the bounding boxes are packed with
+    `pack_rectangles()`.
+
+    Args:
+        vertices (np.ndarray): V x 3 array of vertex coordinates
+        faces (np.ndarray): F x 3 array of triangle vertex indices
+        vt (np.ndarray): U x 2 array of UV coordinates of the chart vertices
+        ft (np.ndarray): F x 3 array of indices into vt
+        vt_charts (np.ndarray): U array of the chart of every chart vertex
+        padding (float): space between the charts, as a fraction of the UV square
+        num_angles (int): number of rotations tried for every chart
+
+    Returns:
+        vt (np.ndarray): U x 2 array of packed UV coordinates
+        utilization (float): fraction of the unit square covered by triangles
+    """
+    num_charts = vt_charts.max() + 1
+    face_charts = vt_charts[ft[:, 0]]
+    triangles = vertices[faces]
+    surface_areas = np.linalg.norm(np.cross(
+        triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1) / 2
+    uv_areas = np.abs(_signed_areas(vt[ft]))
+    scale = np.sqrt(
+        np.bincount(face_charts, surface_areas, num_charts) /
+        np.maximum(np.bincount(face_charts, uv_areas, num_charts), 1e-30)
+    )
+    vt = vt * scale[vt_charts, None]
+
+    # Rotate every chart to the angle giving the smallest bounding box among
+    # `num_angles` angles in [0, 90) degrees
+    best_area = np.full(num_charts, np.inf)
+    best_angle = np.zeros(num_charts)
+    for angle in np.linspace(0, np.pi / 2, num_angles, endpoint=False):
+        rotated = _rotate(vt, np.full(vt.shape[0], angle))
+        lo, hi = _chart_bounds(rotated, vt_charts, num_charts)
+        area = np.prod(hi - lo, axis=1)
+        better = area < best_area
+        best_area[better], best_angle[better] = area[better], angle
+    vt = _rotate(vt, best_angle[vt_charts])
+    lo, hi = _chart_bounds(vt, vt_charts, num_charts)
+
+    # The padding is relative to the final square, whose side is about the square root
+    # of the total chart area
+    gap = padding * math.sqrt(np.sum(np.prod(hi - lo, axis=1)))
+    positions, extent = pack_rectangles(torch.from_numpy(hi - lo + gap), num_widths=16)
+    positions = positions.numpy()
+
+    vt = (vt - lo[vt_charts] + gap / 2 + positions[vt_charts]) / extent
+    utilization = np.sum(np.abs(_signed_areas(vt[ft]))).item()
+    return vt, utilization
+
+def _signed_areas(triangles):
+    # Signed areas of F x 3 x 2 triangles, positive for counter-clockwise triangles
+    e1 = triangles[:, 1] - triangles[:, 0]
+    e2 = triangles[:, 2] - triangles[:, 0]
+    return (e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]) / 2
+
+def _rotate(points, angles):
+    # Rotate N x 2 points counter-clockwise by N angles
+    cos, sin = np.cos(angles), np.sin(angles)
+    return np.stack((
+        cos * points[:, 0] - sin * points[:, 1],
+        sin * points[:, 0] + cos * points[:, 1]
+    ), axis=1)
+
+def _chart_bounds(vt, vt_charts, num_charts):
+    # Lower and upper corners of the bounding box of every chart
+    lo = np.full((num_charts, 2), np.inf)
+    hi = np.full((num_charts, 2), -np.inf)
+    np.minimum.at(lo, vt_charts, vt)
+    np.maximum.at(hi, vt_charts, vt)
+    return lo, hi
@@ -1,65 +1,116 @@
+import os
+import re
+import hashlib
 import numpy as np
 
 class Mesh:
-    def __init__(self, path, torch=False):
-        self.load(path, torch=torch)
+    def __init__(self, path, torch=False, cache_dir=None):
+        self.load(path, torch=torch, cache_dir=cache_dir)
 
-    def load(self, path, torch):
-        vertices = []
-        colors = []
-        faces = []
-        normals = []
-        vt = []
-        uv = []
-        with open(path, "r") as f:
-            content = f.readlines()
-            if ".obj" in path:
-                for line in content:
-                    elems = line.split(" ")
-                    if elems[0] == "v":
-                        vertices.append([float(cord) for cord in elems[1:4]])
-                        if len(elems[4:]) > 0:
-                            colors.append([int(255 * float(rgb)) for rgb in elems[4:]])
-                    if elems[0] == "f":
-                        if "//" in elems[1]:
-                            faces.append(
-                                [int(vert.split("//")[0]) - 1 for vert in elems[1:]]
-                            )
-                        elif "/" in elems[1]:
-                            faces.append(
-                                [int(vert.split("/")[0]) - 1 for vert in elems[1:]]
-                            )
-                        elif "/1/" in elems[1]:
-                            faces.append(
-                                [int(vert.split("/1/")[0]) - 1 for vert in elems[1:]]
-                            )
-                        else:
-                            faces.append([int(vert) - 1 for vert in elems[1:]])
-                    if elems[0] == "vn":
-                        normals.append([float(normal) for normal in elems[1:]])
-                    if elems[0] == "vt":
-                        vt.append([float(uv) for uv in elems[1:]])
-                for line in content:
-                    elems = line.split(" ")
-                    if elems[0] == "f":
-                        if "//" in elems[1]:
-                            pass
-                        elif "/" in elems[1]:
-                            for vert in elems[1:]:
-                                uv.append(vt[int(vert.split("/")[1]) - 1])
+    def load(self, path, torch, cache_dir=None):
+        """ Load an OBJ file
+
+        The file is read once: the "v", "vn", "vt" and "f" records are extracted with
+        regular expressions and the numbers of each record type are parsed at once with
+        NumPy. If a `cache_dir` is given, the parsed arrays are stored in it, so loading
+        the same unchanged file again only reads a binary file.
+
+        Args:
+            path (str): path of the OBJ file
+            torch (bool): store the arrays as torch tensors instead of NumPy arrays
+            cache_dir (str): optional directory of the binary cache (e.g. "cache/obj")
+        """
+        arrays = None
+        cache_path = None
+        if cache_dir is not None and ".obj" in path:
+            stat = os.stat(path)
+            key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+            cache_path = os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".npz")
+            if os.path.exists(cache_path):
+                with np.load(cache_path) as cached:
+                    arrays = dict(cached)
+        if arrays is None:
+            arrays = load_obj(path) if ".obj" in path else {
+                name: np.array([]) for name in ("vertices", "faces", "colors", "normals", "vt", "uv")}
+            if cache_path is not None:
+                # Write to a temporary file first so that the cache never holds partial files
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = cache_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp_path, cache_path)
 
         if torch:
             import torch
-            self.vertices = torch.FloatTensor(vertices)
-            self.faces = torch.Tensor(faces).long()
-            self.colors = torch.tensor(colors)
-            self.normals = torch.tensor(normals)
-            self.vt = torch.tensor(vt)
-            self.uv = torch.tensor(uv)
+            # Arrays that already have the tensor dtype (the integer faces and colors) are
+            # wrapped without a copy; the float64 coordinates are converted to float32
+            self.vertices = torch.from_numpy(arrays["vertices"].astype(np.float32, copy=False))
+            self.faces = torch.from_numpy(arrays["faces"].astype(np.int64, copy=False))
+            self.colors = torch.from_numpy(arrays["colors"].astype(np.int64, copy=False))
+            self.normals = torch.from_numpy(arrays["normals"].astype(np.float32, copy=False))
+            self.vt = torch.from_numpy(arrays["vt"].astype(np.float32, copy=False))
+            self.uv = torch.from_numpy(arrays["uv"].astype(np.float32, copy=False))
         else:
-            self.vertices = np.array(vertices)
-            self.faces = np.array(faces)
-            self.colors = np.array(colors)
-            self.normals = np.array(normals)
-            self.vt = np.array(vt)
-            self.uv = np.array(uv)
+            self.vertices = arrays["vertices"]
+            self.faces = arrays["faces"]
+            self.colors = arrays["colors"]
+            self.normals = arrays["normals"]
+            self.vt = arrays["vt"]
+            self.uv = arrays["uv"]
+
+def load_obj(path):
+    """ Parse the vertices, faces, colors, normals and UVs of an OBJ file
+
+    Args:
+        path (str): path of the OBJ file
+
+    Returns:
+        arrays (dict): "vertices" (V x 3), "faces" (F x K), "colors" (V x 3, integers in
+            [0, 255], if the vertices have colors), "normals" (N x 3), "vt" (T x 2) and
+            "uv" (UVs of the face corners that have UV indices)
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+
+    v = _parse_records(re.findall(rb"^v +([^\n]*)", content, re.M))
+    normals = _parse_records(re.findall(rb"^vn +([^\n]*)", content, re.M))
+    vt = _parse_records(re.findall(rb"^vt +([^\n]*)", content, re.M))
+    f_lines = re.findall(rb"^f +([^\n]*)", content, re.M)
+
+    vertices = v[:, :3] if v.size else v
+    colors = (255 * v[:, 3:]).astype(np.int64) if v.size and v.shape[1] > 3 else np.array([])
+    if len(f_lines) == 0:
+        return dict(vertices=vertices, faces=np.array([]), colors=colors, normals=normals, vt=vt, uv=np.array([]))
+
+    corners = _parse_corners(b" ".join(f_lines))
+    faces = _to_zero_based(corners[:, 0], len(vertices)).reshape(len(f_lines), -1)
+    has_uv = corners[:, 1] != 0
+    uv = vt[_to_zero_based(corners[has_uv, 1], len(vt))] if has_uv.any() else np.array([])
+    return dict(vertices=vertices, faces=faces, colors=colors, normals=normals, vt=vt, uv=uv)
+
+def _parse_records(lines):
+    # All records of a type are parsed as one flat array of numbers
+    if len(lines) == 0:
+        return np.array([])
+    return np.fromstring(b" ".join(lines), dtype=np.float64, sep=" ").reshape(len(lines), -1)
+
+def _parse_corners(corners):
+    # Face corners are "v", "v/vt", "v//vn" or "v/vt/vn". Missing indices become 0.
+    # Returns an N x 3 array of (v, vt, vn) indices of the N corners.
+    corners = corners.replace(b"//", b"/0/")
+    num_fields = corners.split(None, 1)[0].count(b"/") + 1
+    indices = np.fromstring(corners.replace(b"/", b" "), dtype=np.int64, sep=" ")
+    num_corners = len(indices) // num_fields
+    if len(indices) != num_corners * num_fields or corners.count(b"/") != num_corners * (num_fields - 1):
+        # Mixed corner formats: parse every corner on its own
+        indices = [
+            (fields + [b"0", b"0"])[:3]
+            for fields in (corner.split(b"/") for corner in corners.split())
+        ]
+        return np.array(indices, dtype=np.int64)
+    indices = indices.reshape(num_corners, num_fields)
+    return np.pad(indices, ((0, 0), (0, 3 - num_fields)))
+
+def _to_zero_based(indices, count):
+    # OBJ indices start at 1, negative indices count from the end
+    return np.where(indices > 0, indices - 1, indices + count)
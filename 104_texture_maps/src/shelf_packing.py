@@ -0,0 +1,160 @@
+import math
+import torch
+
+def align_longest_edge(triangles):
+    """
+    Rotate every triangle so that its longest edge lies on the x axis with the third
+    vertex above it, and translate it so that its bounding box starts at the origin.
+    With this orientation the bounding box is as low as possible and the triangle fills
+    half of it.
+
+    Args:
+        triangles (torch.tensor): F x 3 x 2 array of triangle coordinates
+
+    Returns:
+        triangles (torch.tensor): F x 3 x 2 array of aligned triangle coordinates
+    """
+    idx = torch.arange(triangles.shape[0], device=triangles.device)
+    # Edge k goes from corner k to corner k+1
+    edges = triangles.roll(-1, dims=1) - triangles
+    longest = torch.argmax(torch.linalg.norm(edges, dim=-1), dim=1)
+    direction = edges[idx, longest]
+    direction = direction / torch.linalg.norm(direction, dim=-1, keepdim=True)
+
+    # Rotate the longest edge onto the x axis (rotations keep the orientation)
+    points = triangles - triangles[idx, longest].unsqueeze(1)
+    aligned = torch.stack((
+        points[..., 0] * direction[:, None, 0] + points[..., 1] * direction[:, None, 1],
+        points[..., 1] * direction[:, None, 0] - points[..., 0] * direction[:, None, 1]
+    ), dim=-1)
+    # Clockwise triangles end up below the x axis, turn them by 180 degrees
+    below = aligned[..., 1].sum(dim=1) < 0
+    aligned = torch.where(below[:, None, None], -aligned, aligned)
+    return aligned - aligned.min(dim=1).values.unsqueeze(1)
+
+def pair_triangles(triangles):
+    """
+    Pair aligned triangles of similar height into quads. Triangles are sorted by height
+    and every second one is turned by 180 degrees and moved next to the previous one,
+    as close as possible without overlapping.
+
+    Args:
+        triangles (torch.tensor): F x 3 x 2 array of aligned triangles (see
+            `align_longest_edge()`)
+
+    Returns:
+        triangles (torch.tensor): F x 3 x 2 array of triangle coordinates within their
+            item (pair or single triangle)
+        item_ids (torch.tensor): F array of the item of every triangle
+        sizes (torch.tensor): I x 2 bounding box size of every item
+    """
+    device = triangles.device
+    num_triangles = triangles.shape[0]
+    width = triangles[..., 0].max(dim=1).values
+    height = triangles[..., 1].max(dim=1).values
+    apex = triangles[torch.arange(num_triangles, device=device), triangles[..., 1].argmax(dim=1), 0]
+
+    order = torch.argsort(height, descending=True)
+    a, b = order[0:num_triangles - 1:2], order[1::2]
+
+    # Turn b by 180 degrees and put its base at the top of a. The left edge of b must
+    # stay right of the right edge of a where both overlap; both edges are straight, so
+    # testing the bottom of b and the apex of a is enough.
+    y = height[a] - height[b]
+    right_a = width[a] - (width[a] - apex[a]) * y / height[a]
+    shift = torch.maximum(apex[a], right_a - (width[b] - apex[b]))
+    turned = torch.stack((width[b], height[b]), dim=1).unsqueeze(1) - triangles[b]
+    triangles = triangles.clone()
+    triangles[b] = turned + torch.stack((shift, y), dim=1).unsqueeze(1)
+
+    item_ids = torch.empty(num_triangles, dtype=torch.long, device=device)
+    item_ids[a] = torch.arange(a.shape[0], device=device)
+    item_ids[b] = torch.arange(b.shape[0], device=device)
+    sizes = torch.stack((torch.maximum(width[a], shift + width[b]), height[a]), dim=1)
+    if num_triangles % 2 == 1:
+        # The lowest triangle stays single
+        item_ids[order[-1]] = a.shape[0]
+        sizes = torch.cat((sizes, torch.stack((width[order[-1:]], height[order[-1:]]), dim=1)))
+    return triangles, item_ids, sizes
+
+def shelf_pack(sizes, bin_width):
+    """
+    Place rectangles on shelves (next fit decreasing height). Rectangles are sorted by
+    height and placed left to right; a new shelf is started on top of the previous
+    one when a rectangle does not fit into the width anymore.
+
+    Args:
+        sizes (torch.tensor): N x 2 rectangle sizes
+        bin_width (float): width of the shelves
+
+    Returns:
+        positions (torch.tensor): N x 2 position of the lower left corner of every
+            rectangle
+        height (float): total height of the shelves
+    """
+    order = torch.argsort(sizes[:, 1], descending=True).tolist()
+    widths, heights = sizes[:, 0].tolist(), sizes[:, 1].tolist()
+    positions = [None] * len(order)
+    x, y, shelf_height = 0.0, 0.0, 0.0
+    for i in order:
+        if x > 0 and x + widths[i] > bin_width:
+            x, y, shelf_height = 0.0, y + shelf_height, 0.0
+        positions[i] = (x, y)
+        x += widths[i]
+        shelf_height = max(shelf_height, heights[i])
+    return torch.tensor(positions, device=sizes.device).view(-1, 2), y + shelf_height
+
+def pack_rectangles(sizes, num_widths=16):
+    """
+    Pack rectangles into a square with `shelf_pack()`. Several shelf widths around the
+    square root of the total area are tried and the most square layout is kept.
+
+    Args:
+        sizes (torch.tensor): N x 2 rectangle sizes
+        num_widths (int): number of shelf widths to try
+
+    Returns:
+        positions (torch.tensor): N x 2 position of the lower left corner of every
+            rectangle
+        extent (float): side length of the square containing all rectangles
+    """
+    side = math.sqrt(torch.sum(sizes[:, 0] * sizes[:, 1]).item())
+    min_width = sizes[:, 0].max().item()
+    best = None
+    for factor in torch.linspace(0.9, 1.5, num_widths).tolist():
+        positions, height = shelf_pack(sizes, max(side * factor, min_width))
+        extent = max(height, (positions[:, 0] + sizes[:, 0]).max().item())
+        if best is None or extent < best[1]:
+            best = (positions, extent)
+    return best
+
+def pack_triangles_shelf(triangles, pair=True, num_widths=16):
+    """
+    Pack triangles into the unit square with a shelf packer. All triangles are scaled
+    by the same factor, so the parameterization stays area-preserving up to a global
+    scale.
+
+    Args:
+        triangles (torch.tensor): F x 3 x 2 array of triangle coordinates
+        pair (bool): pair triangles into quads before packing
+        num_widths (int): number of shelf widths to try; the one giving the most square
+            layout is kept
+
+    Returns:
+        packed_triangles (torch.tensor): F x 3 x 2 array of packed triangle coordinates
+        utilization (float): fraction of the unit square covered by triangles
+    """
+    aligned = align_longest_edge(triangles)
+    if pair:
+        aligned, item_ids, sizes = pair_triangles(aligned)
+    else:
+        item_ids = torch.arange(triangles.shape[0], device=triangles.device)
+        sizes = aligned.max(dim=1).values
+
+    positions, extent = pack_rectangles(sizes, num_widths=num_widths)
+
+    packed_triangles = (aligned + positions[item_ids].unsqueeze(1)) / extent
+    e1 = packed_triangles[:, 1] - packed_triangles[:, 0]
+    e2 = packed_triangles[:, 2] - packed_triangles[:, 0]
+    utilization = torch.sum(torch.abs(e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0])).item() / 2
+    return packed_triangles, utilization
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 
 def trivial_parameterization(triangles):
@@ -29,4 +30,67 @@ def trivial_parameterization(triangles):
     ), dim=1)
     uvs = torch.stack((uv0, uv1, uv2), dim=1)
 
-    return uvs, origins, basis1, basis2
\ No newline at end of file
+    return uvs, origins, basis1, basis2
+
+def fused_trivial_parameterization(triangles, out=None):
+    """
+    Same 2D triangle coordinates as `trivial_parameterization()` (first vertex at the
+    origin, first edge on the x axis, third vertex above it), computed directly from the
+    edge lengths and one dot product per triangle instead of building the local bases:
+        uv1 = (|e1|, 0)
+        uv2 = (e1.e2 / |e1|, sqrt(|e2|^2 - (e1.e2 / |e1|)^2))
+    This needs far fewer temporary tensors. The height of nearly degenerate triangles
+    loses precision (about the square root of the machine epsilon times the edge
+    length), use float64 triangles if slivers matter.
+
+    Args:
+        triangles (torch.tensor): F x 3 x 3 array of triangle vertex coordinates
+        out (torch.tensor): optional F x 3 x 2 tensor to write the coordinates into
+
+    Returns:
+        uvs (torch.tensor): F x 3 x 2 array of 2D triangle coordinates
+    """
+    if out is None:
+        out = torch.empty(triangles.shape[0], 3, 2, dtype=triangles.dtype, device=triangles.device)
+    e1 = triangles[:, 1] - triangles[:, 0]
+    e2 = triangles[:, 2] - triangles[:, 0]
+    length1 = torch.einsum('bi,bi->b', e1, e1).sqrt_()
+    x2 = torch.einsum('bi,bi->b', e1, e2).div_(length1)
+    # The squared length of e2 minus x2^2 is the squared height, clamped against
+    # rounding for degenerate triangles
+    y2 = torch.einsum('bi,bi->b', e2, e2).sub_(x2 * x2).clamp_(min=0).sqrt_()
+
+    out[:, 0].zero_()
+    out[:, 1, 0] = length1
+    out[:, 1, 1] = 0
+    out[:, 2, 0] = x2
+    out[:, 2, 1] = y2
+    return out
+
+def fused_trivial_parameterization_np(triangles, out=None):
+    """ NumPy version of `fused_trivial_parameterization()`
+
+    Args:
+        triangles (np.ndarray): F x 3 x 3 array of triangle vertex coordinates
+        out (np.ndarray): optional F x 3 x 2 array to write the coordinates into
+
+    Returns:
+        uvs (np.ndarray): F x 3 x 2 array of 2D triangle coordinates
+    """
+    if out is None:
+        out = np.empty((triangles.shape[0], 3, 2), dtype=triangles.dtype)
+    e1 = triangles[:, 1] - triangles[:, 0]
+    e2 = triangles[:, 2] - triangles[:, 0]
+    length1 = np.sqrt(np.einsum('bi,bi->b', e1, e1))
+    x2 = np.einsum('bi,bi->b', e1, e2)
+    x2 /= length1
+    y2 = np.einsum('bi,bi->b', e2, e2)
+    y2 -= x2 * x2
+    np.sqrt(np.maximum(y2, 0, out=y2), out=y2)
+
+    out[:, 0] = 0
+    out[:, 1, 0] = length1
+    out[:, 1, 1] = 0
+    out[:, 2, 0] = x2
+    out[:, 2, 1] = y2
+    return out
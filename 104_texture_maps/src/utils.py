@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
 from matplotlib.tri import Triangulation
+from PIL import Image
 import numpy as np
-from igl import grad
 
 def plot_uvs(savefile, vt, ft, img,
                  name, linewidth=1,
@@ -38,10 +38,132 @@ def plot_uvs(savefile, vt, ft, img,
     plt.axis('off')
     axs.axis('equal')
     plt.savefig(savefile)
+    plt.close(fig)
+
+def save_uv_overlay(savefile, vt, ft, img=None, resolution=1024, linewidth=1, color=(0, 0, 0),
+                    xmin=0, xmax=1, ymin=0, ymax=1, max_samples=1 << 22):
+    """ Draw the UV triangle edges over a texture image and save it as a PNG
+
+    Unlike `plot_uvs()`, the edges are rasterized directly into an image at the
+    resolution of the texture (see `rasterize_uv_edges()`), so large atlases are drawn
+    quickly and with bounded memory.
+
+    Args:
+        savefile (str): the path to save the image
+        vt (torch.tensor): V x 2 array of UV coordinates
+        ft (torch.tensor): F x 3 integer array of face indices
+        img (np.ndarray): H x W x C texture image with values in [0, 1] (or uint8), or
+            None for a white background
+        resolution (int): size of the image if img is None
+        linewidth (int): the width of the triangle edges in pixels
+        color (tuple): RGB color of the edges, integers in [0, 255]
+        xmin (float): the minimum x value of the image
+        xmax (float): the maximum x value of the image
+        ymin (float): the minimum y value of the image
+        ymax (float): the maximum y value of the image
+        max_samples (int): maximum number of edge samples rasterized at once
+
+    Returns:
+        image (np.ndarray): H x W x 3 uint8 image
+    """
+    if img is None:
+        image = np.full((resolution, resolution, 3), 255, dtype=np.uint8)
+    else:
+        img = np.asarray(img)
+        if img.dtype != np.uint8:
+            img = np.clip(np.rint(img * 255), 0, 255).astype(np.uint8)
+        image = np.repeat(img[..., None], 3, axis=2) if img.ndim == 2 else img[..., :3].copy()
+
+    mask = rasterize_uv_edges(vt, ft, image.shape[0], image.shape[1],
+                              xmin, xmax, ymin, ymax, max_samples=max_samples)
+    # Thicken the lines by taking the maximum over a linewidth x linewidth window
+    lo, hi = -((linewidth - 1) // 2), linewidth // 2
+    thick = np.zeros_like(mask)
+    for dy in range(lo, hi + 1):
+        for dx in range(lo, hi + 1):
+            thick[max(dy, 0):mask.shape[0] + min(dy, 0), max(dx, 0):mask.shape[1] + min(dx, 0)] |= \
+                mask[max(-dy, 0):mask.shape[0] + min(-dy, 0), max(-dx, 0):mask.shape[1] + min(-dx, 0)]
+    image[thick] = color
+    Image.fromarray(image).save(savefile)
+    return image
+
+def rasterize_uv_edges(vt, ft, height, width, xmin=0, xmax=1, ymin=0, ymax=1, max_samples=1 << 22):
+    """ Rasterize the edges of UV triangles into a boolean image
+
+    Every unique edge is clipped to the image and sampled once per pixel along its major
+    axis (a vectorized DDA line rasterizer). The samples of all edges are generated at
+    once, in chunks of at most `max_samples` samples. Row 0 of the image is at v = ymax,
+    as with `imshow(origin='upper')`.
+
+    Args:
+        vt (torch.tensor): V x 2 array of UV coordinates
+        ft (torch.tensor): F x 3 integer array of face indices
+        height (int): number of image rows
+        width (int): number of image columns
+        xmin (float): u coordinate of the left border of the image
+        xmax (float): u coordinate of the right border of the image
+        ymin (float): v coordinate of the bottom border of the image
+        ymax (float): v coordinate of the top border of the image
+        max_samples (int): maximum number of edge samples rasterized at once
+
+    Returns:
+        mask (np.ndarray): height x width boolean array, True on the edges
+    """
+    vt = np.asarray(vt.detach().cpu() if hasattr(vt, "detach") else vt, dtype=np.float64)
+    ft = np.asarray(ft.detach().cpu() if hasattr(ft, "detach") else ft, dtype=np.int64)
+
+    # Unique edges, shared edges are drawn once
+    edges = np.sort(ft[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edges = np.unique(edges[:, 0] * vt.shape[0] + edges[:, 1])
+    edges = np.stack((edges // vt.shape[0], edges % vt.shape[0]), axis=1)
+
+    # Pixel coordinates, pixel (row, col) covers [col - 0.5, col + 0.5] x [row - 0.5, row + 0.5]
+    points = np.stack((
+        (vt[:, 0] - xmin) / (xmax - xmin) * width - 0.5,
+        (ymax - vt[:, 1]) / (ymax - ymin) * height - 0.5
+    ), axis=1)
+    start, direction = points[edges[:, 0]], points[edges[:, 1]] - points[edges[:, 0]]
+
+    # Clip the segments to the image (Liang-Barsky) so that edges far outside cost nothing
+    t0, t1 = np.zeros(len(edges)), np.ones(len(edges))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for axis, size in ((0, width), (1, height)):
+            for p, q in ((-direction[:, axis], start[:, axis] + 0.5),
+                         (direction[:, axis], size - 0.5 - start[:, axis])):
+                t = q / p
+                t0 = np.where(p < 0, np.maximum(t0, t), t0)
+                t1 = np.where(p > 0, np.minimum(t1, t), t1)
+                # Parallel to the border and outside of it
+                t1 = np.where((p == 0) & (q < 0), -1, t1)
+    visible = (t0 <= t1) & np.isfinite(start).all(axis=1) & np.isfinite(direction).all(axis=1)
+    start, direction = start[visible] + t0[visible, None] * direction[visible], \
+        (t1 - t0)[visible, None] * direction[visible]
+
+    mask = np.zeros((height, width), dtype=bool)
+    counts = np.ceil(np.abs(direction).max(axis=1)).astype(np.int64) + 1
+    ends = np.cumsum(counts)
+    chunk_starts = np.searchsorted(ends, np.arange(0, ends[-1] if len(ends) else 0, max_samples), side="right")
+    for first, last in zip(chunk_starts, np.append(chunk_starts[1:], len(counts))):
+        if first >= last:
+            continue
+        chunk_counts = counts[first:last]
+        edge = np.repeat(np.arange(first, last), chunk_counts)
+        step = np.arange(len(edge)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        t = step / np.maximum(chunk_counts - 1, 1)[edge - first]
+        samples = np.floor(start[edge] + t[:, None] * direction[edge] + 0.5).astype(np.int64)
+        cols = np.clip(samples[:, 0], 0, width - 1)
+        rows = np.clip(samples[:, 1], 0, height - 1)
+        mask[rows, cols] = True
+    return mask
 
 def get_jacobian(vs, fs, uvmap):
     """ Get jacobian of mesh given an input UV map
 
+    The jacobian of every face is computed in closed form from its corners: the
+    gradient of the hat function of corner i is n x e_i / |n|^2, where n is the
+    (area weighted) face normal and e_i the edge opposite corner i. This is the same
+    gradient as igl.grad, without building the 3F x V gradient matrix.
+
     Args:
         vs (np.ndarray): V x 3 array of vertex positions
         fs (np.ndarray): F x 3 integer array of face indices
@@ -50,17 +172,24 @@ def get_jacobian(vs, fs, uvmap):
     Returns:
         J (np.array): F x 3 x 2 array of jacobians
     """
-    # Visualize distortion
-    G = np.array(grad(vs, fs).todense())
+    return get_face_jacobian(vs[fs], uvmap[fs])
 
-    # NOTE: currently gradient is organized as X1, X2, X3, ... Y1, Y2, Y3, ... Z1, Z2, Z3 ... reshape to X1, Y1, Z1, ...
-    splitind = G.shape[0]//3
-    newG = np.zeros_like(G) # F*3 x V
-    newG[::3] = G[:splitind]
-    newG[1::3] = G[splitind:2*splitind]
-    newG[2::3] = G[2*splitind:]
+def get_face_jacobian(face_vertices, face_uvs):
+    """ Get the jacobian of every face of a triangle soup
+
+    Args:
+        face_vertices (np.ndarray): F x 3 x 3 array of corner positions
+        face_uvs (np.ndarray): F x 3 x 2 array of corner UV coordinates
 
-    J = (newG @ uvmap).reshape(-1, 3, 2) # F x 3 x 2
+    Returns:
+        J (np.array): F x 3 x 2 array of jacobians
+    """
+    normals = np.cross(face_vertices[:, 1] - face_vertices[:, 0], face_vertices[:, 2] - face_vertices[:, 0])
+    # Edge opposite to every corner: e_i = v_{i+2} - v_{i+1}
+    edges = face_vertices[:, [2, 0, 1]] - face_vertices[:, [1, 2, 0]]
+    # Gradients of the hat functions of the corners: F x 3 (corner) x 3 (xyz)
+    grads = np.cross(normals[:, None], edges) / np.sum(normals ** 2, axis=-1)[:, None, None]
+    J = np.einsum("fcx,fck->fxk", grads, face_uvs) # F x 3 x 2
     return J
 
 def compute_distortion(vertices, faces, uvs):
@@ -75,8 +204,6 @@ def compute_distortion(vertices, faces, uvs):
         S (np.array): the singular values of the jacobian
 
     """
-    corner_vertices = vertices[faces].reshape(-1, 3)
-    corner_faces = np.arange(faces.shape[0]*3).reshape(-1, 3)
-    J = get_jacobian(corner_vertices, corner_faces, uvs)
-    _, S, _ = np.linalg.svd(J)
-    return S
\ No newline at end of file
+    J = get_face_jacobian(vertices[faces], uvs.reshape(-1, 3, 2))
+    S = np.linalg.svd(J, compute_uv=False)
+    return S
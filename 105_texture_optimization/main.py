@@ -3,32 +3,62 @@ import torchvision
 import random
 import os
 import numpy as np
+from functools import partial
 from src.render import Renderer
 from src.mesh import Mesh, compute_uv_map
 from src.get_target_renders import get_target_renders
 from src.utils import get_texels, load_texture_image
 from src.optimize_texture import optimize_texture
+from src.checkpoint import save_artifacts, load_artifacts
+from src.sparse_texture import SparseTexture
+from src.profiler import StageProfiler
+from src.early_stopping import ConvergenceMonitor
+from src.view_sampling import ImportanceViewSampler
+from src.conservative_inverse_map import conservative_inverse_map
 from solution.inverse_map import inverse_map
 
 
 # Set up some global variables
 RENDER_SIZE = 256 # Dimentions of the output rendered image
-DEVICE = "cuda" # Either "cuda" or "cpu"; determines whether the code runs on GPU or CPU
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu" # Either "cuda" or "cpu"; determines whether the code runs on GPU or CPU
+RASTERIZER = "kaolin" if DEVICE == "cuda" else "torch" # Either "kaolin" (GPU only) or "torch" (pure PyTorch, also runs on CPU)
 MESH_PATH = "data/spot.obj" # Path to the mesh file
 TEXTURE_IMAGE_PATH = "data/spot_texture.png" # The target texture image path
 # (can be either "data/uv_grid.png" or "data/spot_texture.png")
 RENDERS_PATH = "rendered_images.png" # Path of the output rendered images
 SEED = 42
 OPTIM_ITERATIONS = 1000
+LEARNING_RATE = 1e-4
 TEXTURE_IMAGE_SIZE = 256
 NUM_RENDERS = 3
 TARGET_UVS = "load" # Either "load" or None
 VIZ_UVS = True
-TOLERANCE = 0.5 # How strict to be about texels lying inside triangles. Lower is more
-# strict and will make the optimization faster, but might introduce seam artifacts due
-# to anti-aliasing. The correct way to handle this would be to include anti-aliasing in
-# our inverse_mapping() function, but this is beyond the scope of this tutorial.
+ANTI_ALIASING = True # Assign every texel overlapped by a triangle to exactly one
+# triangle (conservative rasterization) and dilate the charts by GUTTER texels, instead
+# of using inverse_map() with TOLERANCE. This avoids seam artifacts without assigning
+# texels to several triangles.
+GUTTER = 2 # Number of texels the charts are dilated by
+TOLERANCE = 0.5 # How strict to be about texels lying inside triangles (only used if
+# ANTI_ALIASING is False). Lower is more strict and will make the optimization faster,
+# but might introduce seam artifacts due to anti-aliasing.
 # Recommended values: 1e-6 for cube.obj, 0.5 for spot.obj
+COARSE_TO_FINE_STAGES = 1 # Number of resolution stages; with more than 1 stage the
+# optimization starts at lower texture and render resolutions and doubles them each stage
+RESUME = False # Continue an interrupted optimization and reuse the precomputed UVs and
+# inverse map of a previous run. Resuming fails if any setting that affects the result
+# changed since the checkpoint was saved; delete CHECKPOINT_PATH to start over.
+CHECKPOINT_PATH = "results/checkpoint.pt" # Path of the optimization checkpoint
+CHECKPOINT_EVERY = 100 # Number of iterations between checkpoints
+ARTIFACTS_PATH = "results/artifacts.pt" # Path of the precomputed UVs and inverse map
+XATLAS_CACHE_DIR = "results/xatlas_cache" # Directory of the cached xatlas atlases, None
+# to always recompute them
+EARLY_STOPPING = False # Stop before OPTIM_ITERATIONS once the smoothed loss stops improving
+ADAPTIVE_VIEWS = False # Sample camera directions with a high recent loss more often
+PROFILE = False # Time the stages of the optimization (MLP, bake, render, ...) every
+# 10 iterations, print a summary table and write a Chrome trace to PROFILE_TRACE_PATH
+PROFILE_TRACE_PATH = "results/trace.json"
+SPARSE_TEXTURE = True # Only optimize and store the texels covered by the UV charts; the
+# final texture is also saved with its coverage mask as alpha channel
 
 # Set seed for reproducibility
 random.seed(SEED)
@@ -38,10 +68,18 @@ torch.manual_seed(SEED)
 torch.cuda.manual_seed(SEED)
 
 # Setup
+# Choose how texels are mapped to the surface
+if ANTI_ALIASING:
+    inverse_map = partial(conservative_inverse_map, gutter=GUTTER)
+    tolerance = 0.0
+else:
+    tolerance = TOLERANCE
+
 # Initialize renderer
 renderer = Renderer(
     DEVICE,
-    dim=(RENDER_SIZE, RENDER_SIZE)
+    dim=(RENDER_SIZE, RENDER_SIZE),
+    rasterizer=RASTERIZER
 )
 
 # Load in mesh
@@ -51,9 +89,42 @@ mesh = Mesh(MESH_PATH, device=DEVICE)
 texture_image = torch.ones(1, 3, TEXTURE_IMAGE_SIZE, TEXTURE_IMAGE_SIZE).to(DEVICE)
 
 
+# Load the precomputed UVs and inverse map of a previous run with the same settings
+artifacts_config = {
+    "mesh_path": MESH_PATH,
+    "texture_image_size": TEXTURE_IMAGE_SIZE,
+    "tolerance": tolerance,
+    "anti_aliasing": ANTI_ALIASING,
+    "gutter": GUTTER,
+    "target_uvs": TARGET_UVS,
+}
+artifacts = load_artifacts(ARTIFACTS_PATH, artifacts_config, DEVICE) if RESUME else None
+if artifacts is None:
+    artifacts = {}
+
+# Every setting that affects the optimized texture. It is stored in the checkpoint, and
+# an optimization is only resumed with the same settings.
+run_config = {
+    **artifacts_config,
+    "texture_image_path": TEXTURE_IMAGE_PATH,
+    "render_size": RENDER_SIZE,
+    "rasterizer": RASTERIZER,
+    "seed": SEED,
+    "optim_iterations": OPTIM_ITERATIONS,
+    "learning_rate": LEARNING_RATE,
+    "num_renders": NUM_RENDERS,
+    "coarse_to_fine_stages": COARSE_TO_FINE_STAGES,
+    "early_stopping": EARLY_STOPPING,
+    "adaptive_views": ADAPTIVE_VIEWS,
+    "sparse_texture": SPARSE_TEXTURE,
+}
+
 # Computing a UV parameterization with XAtlas
-uvs, vt, ft = compute_uv_map(mesh)
-uvs = uvs[0]
+if "uvs" in artifacts:
+    uvs, vt, ft = artifacts["uvs"], artifacts["vt"], artifacts["ft"]
+else:
+    uvs, vt, ft = compute_uv_map(mesh, cache_dir=XATLAS_CACHE_DIR)
+    uvs = uvs[0]
 
 # Target setup
 # Load the target texture image
@@ -61,63 +132,132 @@ target_texture_image = load_texture_image(TEXTURE_IMAGE_PATH, renderer.device)
 
 # UV parameterization for the target images
 # If no UVs are provided, we can use the same ones we computed for our optimization
-if TARGET_UVS == "load":
+if "target_uvs" in artifacts:
+    target_uvs = artifacts["target_uvs"]
+elif TARGET_UVS == "load":
     from src.utils import load_uvs
     print(MESH_PATH, "MESH_PATH")
     target_uvs, _ = load_uvs(MESH_PATH)
     target_uvs = target_uvs.to(DEVICE)
 else:
     target_uvs = uvs
+artifacts.update(uvs=uvs, vt=vt, ft=ft, target_uvs=target_uvs)
+save_artifacts(ARTIFACTS_PATH, artifacts_config, **artifacts)
 
 # Optionally, we can visualze the UV parameterization like we did in module 104
 if VIZ_UVS:
-    from src.utils import plot_uvs
+    # The edges are rasterized at the texture resolution, which stays fast for large
+    # meshes (use plot_uvs() for a matplotlib figure)
+    from src.utils import save_uv_overlay
     from PIL import Image
-    test_texture_image = Image.open("data/uv_grid.png")
-    # normalize the texture map values to be between 0 and 1
-    test_texture_image = np.asarray(test_texture_image)[:, :, :3] / 255
-    plot_uvs("test_plot_uvs.png", vt.cpu().numpy(), ft.cpu().numpy(), test_texture_image, "UVs")
+    test_texture_image = np.asarray(Image.open("data/uv_grid.png"))
+    save_uv_overlay("test_plot_uvs.png", vt, ft, test_texture_image)
+
+# Cameras used for the target and final renders. The mesh geometry for these views is
+# computed once and reused for every render.
+view_azim = torch.deg2rad(torch.tensor([-90, 0, 90], device=DEVICE))
+view_elev = torch.deg2rad(torch.tensor([30, 30, 30], device=DEVICE))
+view_radius = torch.tensor([2], device=DEVICE)
+fixed_views = renderer.prepare_views(
+    mesh.vertices,
+    mesh.faces,
+    elev=view_elev,
+    azim=view_azim,
+    radius=view_radius
+)
 
 # Visualize the target renders
 target_renders = get_target_renders(
     mesh,
     renderer,
     target_texture_image,
-    azim=torch.deg2rad(torch.tensor([-90, 0, 90], device=DEVICE)),
-    elev=torch.deg2rad(torch.tensor([30, 30, 30], device=DEVICE)),
-    radius=torch.tensor([2], device=DEVICE),
-    uvs=target_uvs
+    azim=view_azim,
+    elev=view_elev,
+    radius=view_radius,
+    uvs=target_uvs,
+    views=fixed_views
 )
 torchvision.utils.save_image(target_renders, "target_renders.png")
 
-# Get the surface points and texel indices
-texels = get_texels(TEXTURE_IMAGE_SIZE, device=DEVICE)
-surface_points, texel_indices = inverse_map(
-    mesh.vertices,
-    mesh.faces,
-    uvs,
-    texels,
-    tolerance=TOLERANCE
-)
+# Get the surface points and texel indices at the final texture resolution (the last
+# coarse-to-fine stage uses the same ones, and they give the texels of the sparse texture)
+if "surface_points" in artifacts:
+    surface_points, texel_indices = artifacts["surface_points"], artifacts["texel_indices"]
+else:
+    texels = get_texels(TEXTURE_IMAGE_SIZE, device=DEVICE)
+    surface_points, texel_indices = inverse_map(
+        mesh.vertices,
+        mesh.faces,
+        uvs,
+        texels,
+        tolerance=tolerance
+    )
+    artifacts.update(surface_points=surface_points, texel_indices=texel_indices)
+    save_artifacts(ARTIFACTS_PATH, artifacts_config, **artifacts)
 
 # Optimize the texture map
-mlp, texture_image = optimize_texture(
-    mesh,
-    surface_points,
-    texel_indices,
-    uvs,
-    texture_image,
-    renderer,
-    num_renders=NUM_RENDERS,
-    iterations=OPTIM_ITERATIONS,
-    lr=1e-4,
-    device=DEVICE,
-    target_texture=target_texture_image,
-    target_uvs=target_uvs
-)
+if COARSE_TO_FINE_STAGES > 1:
+    from src.coarse_to_fine import coarse_to_fine_schedule, optimize_texture_coarse_to_fine
+    schedule = coarse_to_fine_schedule(
+        TEXTURE_IMAGE_SIZE,
+        RENDER_SIZE,
+        OPTIM_ITERATIONS,
+        num_stages=COARSE_TO_FINE_STAGES
+    )
+    mlp, texture_image = optimize_texture_coarse_to_fine(
+        mesh,
+        uvs,
+        texture_image,
+        renderer,
+        inverse_map,
+        schedule,
+        tolerance=tolerance,
+        device=DEVICE,
+        num_renders=NUM_RENDERS,
+        lr=LEARNING_RATE,
+        target_texture=target_texture_image,
+        target_uvs=target_uvs,
+        checkpoint_path=CHECKPOINT_PATH,
+        checkpoint_every=CHECKPOINT_EVERY,
+        resume=RESUME,
+        config=run_config,
+        sparse_texture=SPARSE_TEXTURE,
+        profiler=StageProfiler(DEVICE, trace_path=PROFILE_TRACE_PATH) if PROFILE else None,
+        monitor=ConvergenceMonitor() if EARLY_STOPPING else None,
+        view_sampler=ImportanceViewSampler() if ADAPTIVE_VIEWS else None
+    )
+else:
+    mlp, texture_image = optimize_texture(
+        mesh,
+        surface_points,
+        texel_indices,
+        uvs,
+        texture_image,
+        renderer,
+        num_renders=NUM_RENDERS,
+        iterations=OPTIM_ITERATIONS,
+        lr=LEARNING_RATE,
+        device=DEVICE,
+        target_texture=target_texture_image,
+        target_uvs=target_uvs,
+        checkpoint_path=CHECKPOINT_PATH,
+        checkpoint_every=CHECKPOINT_EVERY,
+        resume=RESUME,
+        config=run_config,
+        sparse_texture=SPARSE_TEXTURE,
+        profiler=StageProfiler(DEVICE, trace_path=PROFILE_TRACE_PATH) if PROFILE else None,
+        monitor=ConvergenceMonitor() if EARLY_STOPPING else None,
+        view_sampler=ImportanceViewSampler() if ADAPTIVE_VIEWS else None
+    )
 
 # Save the final texture image
-torchvision.utils.save_image(texture_image, "final_texture.png")
+if SPARSE_TEXTURE:
+    # Store the covered texels only, and the image with the coverage mask as alpha
+    sparse_texture = SparseTexture.from_dense(texture_image, texel_indices)
+    sparse_texture.save("final_texture.pt")
+    torchvision.utils.save_image(torch.cat((texture_image, sparse_texture.coverage_mask()), dim=1), "final_texture.png")
+else:
+    torchvision.utils.save_image(texture_image, "final_texture.png")
 
 # Render and save the final textured mesh
 final_renders = renderer.render_texture(
@@ -125,8 +265,6 @@ final_renders = renderer.render_texture(
     mesh.faces,
     uvs,
     texture_image,
-    azim=torch.deg2rad(torch.tensor([-90, 0, 90], device=DEVICE)),
-    elev=torch.deg2rad(torch.tensor([30, 30, 30], device=DEVICE)),
-    radius=torch.tensor([2], device=DEVICE)
+    views=fixed_views
 )
 torchvision.utils.save_image(final_renders, "final_mesh_renders.png")
\ No newline at end of file
@@ -0,0 +1,153 @@
+import math
+import torch
+from .utils import get_texels
+from .conservative_inverse_map import conservative_inverse_map
+
+def face_jacobians(vertices, faces, vt, ft):
+    """ Jacobians of the maps from the mesh triangles to their UV triangles
+
+    Every triangle is flattened into its own frame (first vertex at the origin, first
+    edge on the x axis) and J = U X^-1, with X and U the 2 x 2 matrices of the two edges
+    leaving the first vertex in the frame and in UV space. This is the Jacobian of
+    `get_face_jacobian()` in module 104 written in the frame of the triangle (same
+    singular values), so that its determinant gives the orientation.
+
+    Args:
+        vertices (torch.Tensor): V x 3 array of vertex coordinates
+        faces (torch.Tensor): F x 3 array of triangle vertex indices
+        vt (torch.Tensor): T x 2 array of UV coordinates
+        ft (torch.Tensor): F x 3 array of UV indices of the triangle corners
+
+    Returns:
+        J (torch.Tensor): F x 2 x 2 array of Jacobians
+        areas (torch.Tensor): F array of triangle areas
+    """
+    triangles = vertices[faces.long()].double()
+    e1 = triangles[:, 1] - triangles[:, 0]
+    e2 = triangles[:, 2] - triangles[:, 0]
+    length1 = torch.linalg.norm(e1, dim=1)
+    x2 = torch.einsum('bi,bi->b', e1, e2) / length1
+    y2 = torch.linalg.norm(torch.cross(e1, e2, dim=1), dim=1) / length1
+
+    uv = vt[ft.long()].double()
+    U = torch.stack((uv[:, 1] - uv[:, 0], uv[:, 2] - uv[:, 0]), dim=2)
+    # X = [[length1, x2], [0, y2]] is upper triangular
+    X_inv = torch.zeros_like(U)
+    X_inv[:, 0, 0] = 1 / length1
+    X_inv[:, 0, 1] = -x2 / (length1 * y2)
+    X_inv[:, 1, 1] = 1 / y2
+    return U @ X_inv, length1 * y2 / 2
+
+def analyze_atlas(vertices, faces, vt, ft, texture_size=1024, target_density=None, quantile=0.05,
+                  bytes_per_texel=4):
+    """ Measure how well a UV atlas uses texture memory
+
+    Per face:
+        - area ratio: UV area / surface area. The texel density (texels per unit of
+          surface length) at a texture size n is n * sqrt(area ratio).
+        - singular values s1 >= s2 of the Jacobian (batched SVD): the stretch s1 / s2 is 1
+          for conformal faces, and s1 * s2 relative to the average area ratio is 1 where
+          the density is uniform.
+    Over the atlas:
+        - utilization: total UV area (overlapping faces count several times)
+        - coverage: fraction of the texels at `texture_size` that are overlapped by a
+          triangle, i.e. that have to be stored (see `conservative_inverse_map()`)
+        - the texture size needed so that all but a `quantile` fraction of the surface
+          area get at least `target_density` texels per unit length, and its memory
+
+    Args:
+        vertices (torch.Tensor): V x 3 array of vertex coordinates
+        faces (torch.Tensor): F x 3 array of triangle vertex indices
+        vt (torch.Tensor): T x 2 array of UV coordinates in [0, 1]
+        ft (torch.Tensor): F x 3 array of UV indices of the triangle corners
+        texture_size (int): texture size at which density and coverage are measured
+        target_density (float): texels per unit of surface length to reach, None to
+            skip the texture size estimate
+        quantile (float): fraction of the surface area allowed below the target density
+        bytes_per_texel (int): bytes per texel for the memory estimate (4 for RGBA8)
+
+    Returns:
+        metrics (dict): per-face arrays "area_ratio", "texel_density", "singular_values"
+            (F x 2), "stretch" and "flipped" (NaN and False for degenerate faces)
+        summary (dict): scalar statistics of the atlas
+    """
+    J, areas = face_jacobians(vertices, faces, vt, ft)
+    # Degenerate (zero area) faces have no Jacobian. Their entries are zeroed so that the
+    # batched SVD does not fail on them, and their per-face metrics are NaN.
+    valid = (areas > 0) & torch.isfinite(J).all(dim=2).all(dim=1)
+    J = torch.where(valid[:, None, None], J, 0)
+    singular_values = torch.where(valid[:, None], torch.linalg.svdvals(J), torch.nan)
+    flipped = torch.linalg.det(J) < 0
+    uv_areas = torch.abs(torch.linalg.det(J)) * torch.where(valid, areas, 0)
+    area_ratio = torch.where(valid, uv_areas / areas.clamp(min=1e-30), torch.nan)
+    texel_density = texture_size * torch.sqrt(area_ratio)
+    stretch = singular_values[:, 0] / singular_values[:, 1]
+    metrics = dict(
+        area_ratio=area_ratio,
+        texel_density=texel_density,
+        singular_values=singular_values,
+        stretch=stretch,
+        flipped=flipped,
+    )
+
+    # Texels overlapped by the triangles at the texture size
+    texels = get_texels(texture_size, vertices.device)
+    _, texel_indices = conservative_inverse_map(
+        vertices, faces, vt[ft.long()], texels, gutter=0)
+
+    weights = areas[valid] / areas[valid].sum()
+    mean_ratio = torch.sum(weights * area_ratio[valid])
+    summary = dict(
+        num_faces=faces.shape[0],
+        num_uvs=vt.shape[0],
+        texture_size=texture_size,
+        utilization=uv_areas.sum().item(),
+        coverage=texel_indices.shape[0] / texture_size ** 2,
+        flipped=int(flipped.sum().item()),
+        degenerate=int((~valid).sum().item()),
+        density_mean=(texture_size * torch.sqrt(mean_ratio)).item(),
+    )
+    for q in (0.05, 0.5, 0.95):
+        summary[f"density_p{round(100 * q)}"] = _weighted_quantile(texel_density[valid], weights, q)
+        summary[f"stretch_p{round(100 * q)}"] = _weighted_quantile(stretch[valid], weights, q)
+        # Area distortion relative to the average density: 1 where the density is uniform
+        summary[f"area_scale_p{round(100 * q)}"] = _weighted_quantile(
+            area_ratio[valid] / mean_ratio, weights, q)
+
+    if target_density is not None:
+        # Density scales linearly with the texture size
+        low_density = _weighted_quantile(texel_density[valid], weights, quantile) / texture_size
+        required_size = math.ceil(target_density / low_density)
+        summary.update(
+            target_density=target_density,
+            required_texture_size=required_size,
+            required_memory=required_size ** 2 * bytes_per_texel,
+        )
+    return metrics, summary
+
+def compare_atlases(vertices, faces, atlases, target_density, **kwargs):
+    """ Analyze several atlases of the same mesh and sort them by the texture memory
+    they need to reach `target_density` (see `analyze_atlas()`)
+
+    Args:
+        vertices (torch.Tensor): V x 3 array of vertex coordinates
+        faces (torch.Tensor): F x 3 array of triangle vertex indices
+        atlases (dict): name -> (vt, ft) of every atlas
+        target_density (float): texels per unit of surface length to reach
+        **kwargs: other arguments of `analyze_atlas()`
+
+    Returns:
+        summaries (list): (name, summary) pairs, the cheapest atlas first
+    """
+    summaries = []
+    for name, (vt, ft) in atlases.items():
+        _, summary = analyze_atlas(vertices, faces, vt, ft, target_density=target_density, **kwargs)
+        summaries.append((name, summary))
+    return sorted(summaries, key=lambda item: item[1]["required_memory"])
+
+def _weighted_quantile(values, weights, q):
+    # Value below which a fraction q of the total weight lies
+    order = torch.argsort(values)
+    cumulative = torch.cumsum(weights[order], dim=0)
+    index = torch.searchsorted(cumulative, q * cumulative[-1]).clamp(max=values.shape[0] - 1)
+    return values[order][index].item()
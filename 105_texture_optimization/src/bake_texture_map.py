@@ -13,3 +13,18 @@ def bake_texture_map(features, texel_indices, texture_image):
     flat_texture[texel_indices] = features
     texture = flat_texture.reshape(texture_image.shape[0], texture_image.shape[1])
     return texture
+
+
+def bake_texture_image(features, texel_indices, background):
+    """ Bake multi-channel features into a flattened texture map with a single scatter
+
+    Args:
+        features (torch.Tensor): features to bake of shape (N, C)
+        texel_indices (torch.Tensor): Indices of the texels to bake of shape (N,)
+        background (torch.Tensor): Flattened background texture of shape (H*W, C). It
+            is not modified, so the same buffer can be reused for every bake.
+
+    Returns:
+        torch.Tensor: Baked texture of shape (H*W, C)
+    """
+    return background.index_put((texel_indices,), features.to(background.dtype))
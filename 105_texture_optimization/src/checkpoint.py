@@ -0,0 +1,138 @@
+import os
+import random
+import torch
+import numpy as np
+from pathlib import Path
+
+def atomic_save(obj, path):
+    """ Save an object with `torch.save()` so that `path` is never left half-written
+
+    The object is first written to a temporary file next to `path`, which then replaces
+    `path` in a single rename.
+
+    Args:
+        obj (object): object to save
+        path (str): path of the output file
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+def get_rng_state():
+    """ Get the state of all random number generators used in the optimization """
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    """ Restore the random number generators from `get_rng_state()` """
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+def save_checkpoint(path, mlp, optim, iteration, scaler=None, config=None, monitor=None, view_sampler=None,
+                    stopped=False):
+    """ Save the training state of a texture optimization
+
+    Args:
+        path (str): path of the checkpoint file
+        mlp (MLP): MLP being optimized
+        optim (torch.optim.Optimizer): optimizer
+        iteration (int): next iteration to run
+        scaler (torch.amp.GradScaler): optional gradient scaler
+        config (dict): optional settings of the run (see `load_checkpoint()`)
+        monitor (ConvergenceMonitor): optional early stopping monitor
+        view_sampler (ImportanceViewSampler): optional view sampler
+        stopped (bool): whether the optimization stopped early; it is then not resumed
+    """
+    checkpoint = {
+        "config": config,
+        "iteration": iteration,
+        "stopped": stopped,
+        "mlp": mlp.state_dict(),
+        "optim": optim.state_dict(),
+        "rng": get_rng_state(),
+    }
+    if scaler is not None:
+        checkpoint["scaler"] = scaler.state_dict()
+    if monitor is not None:
+        checkpoint["monitor"] = monitor.state_dict()
+    if view_sampler is not None:
+        checkpoint["view_sampler"] = view_sampler.state_dict()
+    atomic_save(checkpoint, path)
+
+def load_checkpoint(path, mlp, optim, device, scaler=None, config=None, monitor=None, view_sampler=None):
+    """ Restore the training state saved by `save_checkpoint()`
+
+    Args:
+        path (str): path of the checkpoint file
+        mlp (MLP): MLP to load the weights into
+        optim (torch.optim.Optimizer): optimizer to load the state into
+        device (str): device of the MLP
+        scaler (torch.amp.GradScaler): optional gradient scaler
+        config (dict): settings of the current run; the checkpoint must have been saved
+            with the same settings
+        monitor (ConvergenceMonitor): optional early stopping monitor to restore
+        view_sampler (ImportanceViewSampler): optional view sampler to restore
+
+    Returns:
+        iteration (int): next iteration to run
+        stopped (bool): whether the optimization had stopped early
+    """
+    checkpoint = torch.load(path, map_location=device, weights_only=False)
+    if checkpoint.get("config") != config:
+        raise ValueError(
+            f"{path} was saved with different settings ({checkpoint.get('config')}, now {config}); "
+            "delete it or disable resuming to start a new optimization")
+    mlp.load_state_dict(checkpoint["mlp"])
+    optim.load_state_dict(checkpoint["optim"])
+    if scaler is not None and "scaler" in checkpoint:
+        scaler.load_state_dict(checkpoint["scaler"])
+    if monitor is not None and "monitor" in checkpoint:
+        monitor.load_state_dict(checkpoint["monitor"])
+    if view_sampler is not None and "view_sampler" in checkpoint:
+        view_sampler.load_state_dict(checkpoint["view_sampler"])
+    # RNG states always live on the CPU
+    rng = checkpoint["rng"]
+    rng["torch"] = rng["torch"].cpu()
+    if "cuda" in rng:
+        rng["cuda"] = [state.cpu() for state in rng["cuda"]]
+    set_rng_state(rng)
+    return checkpoint["iteration"], checkpoint.get("stopped", False)
+
+def save_artifacts(path, config, **tensors):
+    """ Save precomputed tensors (UVs, surface points, ...) of a run
+
+    Args:
+        path (str): path of the artifacts file
+        config (dict): settings the tensors were computed with
+        **tensors: tensors to save
+    """
+    atomic_save({"config": config, "tensors": {k: v.cpu() for k, v in tensors.items()}}, path)
+
+def load_artifacts(path, config, device):
+    """ Load precomputed tensors saved by `save_artifacts()`
+
+    Args:
+        path (str): path of the artifacts file
+        config (dict): current settings; the artifacts are only used if they were
+            computed with the same settings
+        device (str): device to load the tensors to
+
+    Returns:
+        tensors (dict): the saved tensors, or None if there are no matching artifacts
+    """
+    if not os.path.exists(path):
+        return None
+    artifacts = torch.load(path, map_location=device, weights_only=False)
+    if artifacts["config"] != config:
+        return None
+    return artifacts["tensors"]
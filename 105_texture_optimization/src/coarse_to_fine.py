@@ -0,0 +1,146 @@
+import copy
+import torch
+from pathlib import Path
+
+from .render import Renderer
+from .utils import get_texels
+from .optimize_texture import optimize_texture
+
+def coarse_to_fine_schedule(texture_size, render_size, iterations, num_stages=3):
+    """ Split an optimization into stages of increasing resolution
+
+    Each stage doubles the texture and render resolutions of the previous one and ends
+    at the full resolution. Each stage gets half the iterations of the stage before it,
+    so most iterations run at low resolution.
+
+    Args:
+        texture_size (int): final texture image size
+        render_size (int): final render size
+        iterations (int): total number of iterations over all stages
+        num_stages (int): number of stages
+
+    Returns:
+        schedule (list): list of (texture_size, render_size, iterations) per stage
+    """
+    weights = [2 ** (num_stages - 1 - stage) for stage in range(num_stages)]
+    schedule = []
+    for stage, weight in enumerate(weights):
+        scale = 2 ** (num_stages - 1 - stage)
+        stage_iterations = iterations * weight // sum(weights)
+        if stage == num_stages - 1:
+            stage_iterations = iterations - sum(s[2] for s in schedule)
+        schedule.append((
+            max(texture_size // scale, 1),
+            max(render_size // scale, 1),
+            stage_iterations
+        ))
+    return schedule
+
+def optimize_texture_coarse_to_fine(
+    mesh,
+    uvs,
+    texture_image,
+    renderer,
+    inverse_map,
+    schedule,
+    tolerance=1e-6,
+    device="cuda",
+    checkpoint_path=None,
+    resume=False,
+    profiler=None,
+    monitor=None,
+    view_sampler=None,
+    **kwargs
+):
+    """ Optimize the texture map of a mesh from coarse to fine resolution
+
+    Every stage of the schedule computes the inverse map at its texture resolution and
+    optimizes with renders at its render resolution. The MLP is passed on from one stage
+    to the next, so the fine stages start from the coarse solution.
+
+    Every stage has its own checkpoint, so an interrupted run resumes in the stage it
+    stopped in and skips the stages that were completed.
+
+    Args:
+        mesh (Mesh): Mesh object
+        uvs (torch.Tensor): UV coordinates
+        texture_image (torch.Tensor): Texture image at the final resolution
+        renderer (Renderer): Renderer object
+        inverse_map (function): function computing the surface points and texel indices
+            (see `inverse_map()` in module 105)
+        schedule (list): list of (texture_size, render_size, iterations) per stage, see
+            `coarse_to_fine_schedule()`
+        tolerance (float): Tolerance passed to the inverse map
+        device (str): Device to run the optimization on
+        checkpoint_path (str): Optional path of the checkpoints; stage i is saved to
+            `<name>_stage_i<suffix>`
+        resume (bool): Continue from the stage checkpoints if they exist
+        profiler (StageProfiler): Optional profiler of the last (full resolution) stage
+        monitor (ConvergenceMonitor): Optional monitor stopping a stage early; every
+            stage uses a fresh copy, since the loss changes with the resolution
+        view_sampler (ImportanceViewSampler): Optional view sampler, shared by all stages
+        **kwargs: Other arguments passed to `optimize_texture()`
+
+    Returns:
+        mlp (MLP): Trained MLP used to predict RGB values over the mesh surface
+        texture_image (torch.Tensor): Updated texture image at the final resolution
+    """
+    if not any(iterations > 0 for _, _, iterations in schedule):
+        raise ValueError("The coarse-to-fine schedule has no iterations")
+    last_stage = max(stage for stage, (_, _, iterations) in enumerate(schedule) if iterations > 0)
+
+    mlp = None
+    for stage, (texture_size, render_size, iterations) in enumerate(schedule):
+        if iterations == 0:
+            continue
+        print(f"Stage {stage}: texture size {texture_size}, render size {render_size}, {iterations} iterations")
+
+        # Inverse map at the resolution of this stage
+        texels = get_texels(texture_size, device=device)
+        surface_points, texel_indices = inverse_map(
+            mesh.vertices,
+            mesh.faces,
+            uvs,
+            texels,
+            tolerance=tolerance
+        )
+
+        stage_texture_image = torch.nn.functional.interpolate(
+            texture_image,
+            size=(texture_size, texture_size),
+            mode="bilinear",
+            align_corners=False
+        )
+        stage_renderer = Renderer(
+            device,
+            dim=(render_size, render_size),
+            interpolation_mode=renderer.interpolation_mode,
+            lights=renderer.lights[0],
+            rasterizer=renderer.rasterizer
+        )
+
+        stage_checkpoint_path = None
+        if checkpoint_path is not None:
+            path = Path(checkpoint_path)
+            stage_checkpoint_path = str(path.with_name(f"{path.stem}_stage_{stage}{path.suffix}"))
+
+        mlp, texture_map = optimize_texture(
+            mesh,
+            surface_points,
+            texel_indices,
+            uvs,
+            stage_texture_image,
+            stage_renderer,
+            iterations=iterations,
+            device=device,
+            mlp=mlp,
+            results_dir=f"results/stage_{stage}",
+            checkpoint_path=stage_checkpoint_path,
+            resume=resume,
+            profiler=profiler if stage == last_stage else None,
+            monitor=copy.deepcopy(monitor),
+            view_sampler=view_sampler,
+            **kwargs
+        )
+
+    return mlp, texture_map
@@ -0,0 +1,110 @@
+import torch
+from .rasterizer import edge_function, barycentric_coords
+
+def conservative_inverse_map(vertices, faces, uv_triangles, texels, tolerance=0.0, gutter=2):
+    """ Compute the inverse map from texels to surface points with conservative
+    rasterization and gutter dilation.
+
+    A texel is covered by a triangle if its pixel square overlaps the triangle, so texels
+    along chart borders that are only partially covered (and sampled by bilinear
+    filtering) are included. Every covered texel is assigned to exactly one triangle:
+    the one whose border is furthest away from the texel center (texels whose center
+    lies inside a triangle thus always keep that triangle). Its surface point is
+    interpolated with barycentric coordinates clamped to the triangle, so points of
+    texels outside the triangle stay on its border instead of leaving the surface.
+
+    Uncovered texels up to `gutter` texels away from a chart are then filled with the
+    surface point of a neighboring covered texel. This copies the colors at the chart
+    borders outward, which removes seam artifacts when the texture is filtered or
+    downsampled.
+
+    Args:
+        vertices (torch.tensor): V x 3 array of vertex coordinates
+        faces (torch.tensor): F x 3 array of triangle vertex indices
+        uv_triangles (torch.tensor): F x 3 x 2 array of triangle coordinates in UV space
+        texels (torch.tensor): N x 2 array of texel coordinates (see `get_texels()`)
+        tolerance (float): Additional distance in texels by which the triangles are
+            grown before testing coverage
+        gutter (int): Number of texels to dilate the charts by
+
+    Returns:
+        surface_points (torch.tensor): M x 3 array of surface points
+        texel_indices (torch.tensor): M array of unique texel indices
+    """
+    device = vertices.device
+    n = int(torch.max(texels).item()) + 1
+
+    # Triangles in texel coordinates, the texel (x, y) has index x * n + y
+    tris = uv_triangles.to(device).float() * n
+    a, b, c = tris[:, 0], tris[:, 1], tris[:, 2]
+    area = edge_function(a, b, c)
+    # Orient the edges so that the inside of every triangle is on their positive side
+    sign = torch.sign(area)
+    valid = (area != 0) & torch.isfinite(area)
+
+    # Texel bounding box of each triangle grown by half a texel
+    margin = 0.5 + tolerance
+    lo = torch.ceil(tris.min(dim=1).values - margin).clamp(0, n - 1).long()
+    hi = torch.floor(tris.max(dim=1).values + margin).clamp(0, n - 1).long()
+    size = (hi - lo + 1).clamp(min=0)
+    counts = torch.where(valid & (hi >= lo).all(dim=1), size[:, 0] * size[:, 1], 0)
+
+    # All (triangle, texel) pairs within the bounding boxes
+    pair_tri = torch.repeat_interleave(torch.arange(tris.shape[0], device=device), counts)
+    pair_local = torch.arange(pair_tri.shape[0], device=device) - \
+        torch.repeat_interleave(torch.cumsum(counts, 0) - counts, counts)
+    x = lo[pair_tri, 0] + pair_local // size[pair_tri, 1]
+    y = lo[pair_tri, 1] + pair_local % size[pair_tri, 1]
+    p = torch.stack((x, y), dim=-1).float()
+
+    # Signed distance of the texel centers to the three edges (positive inside)
+    corners = tris[pair_tri]
+    distances = []
+    covered = torch.ones_like(x, dtype=torch.bool)
+    for i in range(3):
+        start, end = corners[:, (i + 1) % 3], corners[:, (i + 2) % 3]
+        edge = end - start
+        length = torch.linalg.norm(edge, dim=-1)
+        distance = sign[pair_tri] * edge_function(start, end, p) / length
+        # The pixel square overlaps the half plane of the edge if its closest corner does
+        extent = 0.5 * (edge[:, 0].abs() + edge[:, 1].abs()) / length
+        covered &= distance + extent + tolerance >= 0
+        distances.append(distance)
+    distances = torch.stack(distances, dim=-1)
+    pair_tri, x, y, p, corners, distances = (
+        t[covered] for t in (pair_tri, x, y, p, corners, distances))
+
+    # Keep the triangle whose border is furthest from the texel center
+    score = distances.min(dim=-1).values
+    texel = x * n + y
+    best_score = torch.full((n * n,), -torch.inf, device=device)
+    best_score.scatter_reduce_(0, texel, score, reduce='amax')
+    best = score == best_score[texel]
+    # Break ties (texels on shared edges) by taking the last pair
+    pair = torch.full((n * n,), -1, dtype=torch.long, device=device)
+    pair.scatter_reduce_(0, texel[best], torch.nonzero(best).squeeze(1), reduce='amax')
+
+    # Surface points, with barycentric coordinates clamped to the triangle
+    weights = torch.clamp(barycentric_coords(corners, p), min=0)
+    weights = weights / weights.sum(dim=-1, keepdim=True)
+    pair_points = torch.einsum("ij,ijk->ik", weights, vertices[faces[pair_tri].long()])
+
+    # Dilate the charts into the gutter
+    pair = _dilate(pair.reshape(n, n), gutter).flatten()
+    texel_indices = torch.nonzero(pair >= 0).squeeze(1)
+    surface_points = pair_points[pair[texel_indices]]
+    return surface_points, texel_indices
+
+def _dilate(source, iterations):
+    # Fill unassigned (-1) entries of a grid with an assigned 8-neighbor, one ring of
+    # entries per iteration
+    n0, n1 = source.shape
+    for _ in range(iterations):
+        padded = torch.nn.functional.pad(source, (1, 1, 1, 1), value=-1)
+        dilated = source.clone()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbor = padded[1 + dx:1 + dx + n0, 1 + dy:1 + dy + n1]
+                dilated = torch.where(dilated < 0, neighbor, dilated)
+        source = dilated
+    return source
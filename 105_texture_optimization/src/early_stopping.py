@@ -0,0 +1,63 @@
+class ConvergenceMonitor:
+    """
+    Decide when to stop an optimization. The loss is smoothed with an exponential
+    moving average (EMA); the optimization stops when the smoothed loss reaches
+    `target_loss`, or when it has not improved by a relative `min_improvement` for
+    `patience` iterations (a plateau).
+
+    Args:
+        ema_decay (float): weight of the previous average in the EMA
+        patience (int): number of iterations without improvement before stopping
+        min_improvement (float): relative decrease of the smoothed loss that counts as
+            an improvement
+        target_loss (float): optional loss at which to stop
+        min_iterations (int): number of iterations before stopping is considered
+    """
+    def __init__(self, ema_decay=0.95, patience=200, min_improvement=1e-2, target_loss=None, min_iterations=100):
+        self.ema_decay = ema_decay
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.target_loss = target_loss
+        self.min_iterations = min_iterations
+        self.ema = None
+        self.best = float("inf")
+        self.iterations = 0
+        self.iterations_since_best = 0
+        self.reason = None
+
+    def update(self, loss):
+        """ Add the loss of an iteration and return True if the optimization should stop """
+        self.iterations += 1
+        if self.ema is None:
+            self.ema = loss
+        else:
+            self.ema = self.ema_decay * self.ema + (1 - self.ema_decay) * loss
+
+        if self.ema < self.best * (1 - self.min_improvement):
+            self.best = self.ema
+            self.iterations_since_best = 0
+        else:
+            self.iterations_since_best += 1
+
+        if self.iterations < self.min_iterations:
+            return False
+        if self.target_loss is not None and self.ema <= self.target_loss:
+            self.reason = f"smoothed loss {self.ema:.6f} reached the target {self.target_loss}"
+        elif self.iterations_since_best >= self.patience:
+            self.reason = f"smoothed loss {self.ema:.6f} did not improve for {self.patience} iterations"
+        return self.reason is not None
+
+    def state_dict(self):
+        """ State of the monitor, to save it in a checkpoint """
+        return {
+            "ema": self.ema,
+            "best": self.best,
+            "iterations": self.iterations,
+            "iterations_since_best": self.iterations_since_best,
+            "reason": self.reason,
+        }
+
+    def load_state_dict(self, state):
+        """ Restore the state saved by `state_dict()` """
+        for name, value in state.items():
+            setattr(self, name, value)
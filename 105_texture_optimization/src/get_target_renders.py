@@ -1,6 +1,6 @@
 from .mesh import compute_uv_map
 
-def get_target_renders(mesh, renderer, texture_image, azim, elev, radius, uvs=None):
+def get_target_renders(mesh, renderer, texture_image, azim, elev, radius, uvs=None, views=None):
     """ Get target renders for the optimization
 
     Args:
@@ -11,6 +11,8 @@ def get_target_renders(mesh, renderer, texture_image, azim, elev, radius, uvs=No
         elev (torch.tensor): tensor of elevation angles
         radius (torch.tensor): tensor of radius values for the camera
         uvs (torch.Tensor): UV coordinates
+        views (ViewSet): optional cached views from `renderer.prepare_views()` for
+            the same mesh and camera parameters
 
     Returns:
         target_renders (torch.Tensor): Target renders
@@ -27,7 +29,8 @@ def get_target_renders(mesh, renderer, texture_image, azim, elev, radius, uvs=No
         texture_image,
         azim=azim,
         elev=elev,
-        radius=radius
+        radius=radius,
+        views=views
     )
 
     return target_renders
\ No newline at end of file
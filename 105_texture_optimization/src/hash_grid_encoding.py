@@ -0,0 +1,101 @@
+import torch
+import numpy as np
+
+
+class HashGridEncoding(torch.nn.Module):
+    """
+    A pure PyTorch implementation of the multiresolution hash encoding.
+    "Instant Neural Graphics Primitives with a Multiresolution Hash Encoding":
+       https://nvlabs.github.io/instant-ngp/
+    The input points are placed in a stack of voxel grids of increasing resolution. For
+    every grid, the features stored at the 8 corners of the voxel containing a point are
+    trilinearly interpolated. Corners of coarse grids index a dense table; corners of
+    fine grids are hashed into a table of fixed size.
+    Given an input of size [batches, num_input_channels],
+     returns a tensor of size [batches, num_levels*features_per_level].
+
+    Args:
+        num_input_channels (int): dimension of the input points (3 for surface points)
+        num_levels (int): number of grid resolutions
+        features_per_level (int): number of features stored per grid corner
+        log2_hashmap_size (int): log2 of the number of entries of each level's table
+        base_resolution (int): resolution of the coarsest grid
+        max_resolution (int): resolution of the finest grid
+        bounds (tuple): (min, max) coordinate of the region covered by the grids
+    """
+
+    # Large primes from the paper (the first dimension is not scaled)
+    PRIMES = [1, 2654435761, 805459861, 3674653429]
+
+    def __init__(
+        self,
+        num_input_channels=3,
+        num_levels=16,
+        features_per_level=2,
+        log2_hashmap_size=16,
+        base_resolution=16,
+        max_resolution=2048,
+        bounds=(-1.0, 1.0),
+    ):
+        super().__init__()
+        assert num_input_channels <= len(self.PRIMES), \
+            "Expected at most {} input channels (got {} channels)".format(len(self.PRIMES), num_input_channels)
+
+        self._num_input_channels = num_input_channels
+        self.num_levels = num_levels
+        self.features_per_level = features_per_level
+        self.table_size = 2 ** log2_hashmap_size
+        self.bounds = bounds
+        self.output_dim = num_levels * features_per_level
+
+        growth = np.exp((np.log(max_resolution) - np.log(base_resolution)) / max(num_levels - 1, 1))
+        resolutions = torch.tensor(
+            [int(np.floor(base_resolution * growth ** level)) for level in range(num_levels)])
+        # Coarse levels whose grids fit into the table are indexed without hashing
+        dense = (resolutions + 1) ** num_input_channels <= self.table_size
+        # Corner offsets of a voxel: (2^D, D)
+        offsets = torch.tensor(
+            [[(corner >> d) & 1 for d in range(num_input_channels)] for corner in range(2 ** num_input_channels)])
+        self.register_buffer('_resolutions', resolutions)
+        self.register_buffer('_dense', dense)
+        self.register_buffer('_offsets', offsets)
+        self.register_buffer('_primes', torch.tensor(self.PRIMES[:num_input_channels]))
+        self.register_buffer('_strides', torch.stack(
+            [(resolutions + 1) ** d for d in range(num_input_channels)], dim=1))
+
+        self.embeddings = torch.nn.Parameter(
+            torch.empty(num_levels * self.table_size, features_per_level).uniform_(-1e-4, 1e-4))
+
+    def forward(self, x):
+        batches, channels = x.shape
+
+        assert channels == self._num_input_channels, \
+            "Expected input to have {} channels (got {} channels)".format(self._num_input_channels, channels)
+
+        # Map the points to [0, 1] and then to the grid of every level: (N, L, D)
+        x = (x - self.bounds[0]) / (self.bounds[1] - self.bounds[0])
+        x = x.clamp(0, 1)
+        positions = x[:, None, :] * self._resolutions[None, :, None]
+        lower = torch.floor(positions).long()
+        lower = torch.minimum(lower, self._resolutions[None, :, None] - 1)
+        frac = positions - lower
+
+        # Integer coordinates of the voxel corners: (N, L, 2^D, D)
+        corners = lower[:, :, None, :] + self._offsets[None, None]
+
+        # Dense index for coarse levels, spatial hash for fine levels: (N, L, 2^D)
+        dense_index = torch.sum(corners * self._strides[None, :, None, :], dim=-1)
+        hashed = corners * self._primes
+        hash_index = hashed[..., 0]
+        for d in range(1, channels):
+            hash_index = torch.bitwise_xor(hash_index, hashed[..., d])
+        index = torch.where(self._dense[None, :, None], dense_index, hash_index) % self.table_size
+        index = index + torch.arange(self.num_levels, device=x.device)[None, :, None] * self.table_size
+
+        # Trilinear interpolation weights of the corners: (N, L, 2^D)
+        weights = torch.where(self._offsets[None, None] == 1, frac[:, :, None, :], 1 - frac[:, :, None, :])
+        weights = torch.prod(weights, dim=-1)
+
+        features = self.embeddings[index]
+        features = torch.sum(weights[..., None] * features, dim=2)
+        return features.reshape(batches, self.output_dim)
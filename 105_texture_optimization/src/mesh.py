@@ -1,25 +1,38 @@
-import kaolin as kal
 import torch
 import copy
+import os
+import hashlib
 import xatlas
 import numpy as np
+from .utils import load_obj
 
 class Mesh:
     def __init__(self,obj_path, device):
-        if ".obj" in obj_path:
+        # kaolin is optional: without it (e.g. on CPU-only machines) OBJ files are read
+        # with `load_obj()`
+        try:
+            import kaolin as kal
+        except ImportError:
+            kal = None
+
+        if ".obj" in obj_path and kal is None:
+            vertices, faces, self.vt, self.ft = load_obj(obj_path)
+        elif ".obj" in obj_path:
             try:
                 mesh = kal.io.obj.import_mesh(obj_path, with_normals=True, with_materials=True)
             except:
                 mesh = kal.io.obj.import_mesh(obj_path, with_normals=True, with_materials=False)
+            vertices, faces, self.vt, self.ft = mesh.vertices, mesh.faces, mesh.uvs, mesh.face_uvs_idx
         elif ".off" in obj_path:
+            if kal is None:
+                raise ImportError("Reading OFF files requires kaolin")
             mesh = kal.io.off.import_mesh(obj_path)
+            vertices, faces, self.vt, self.ft = mesh.vertices, mesh.faces, mesh.uvs, mesh.face_uvs_idx
         else:
             raise ValueError(f"{obj_path} extension not implemented in mesh reader.")
 
-        self.vertices = mesh.vertices.to(device)
-        self.faces = mesh.faces.to(device)
-        self.ft = mesh.face_uvs_idx
-        self.vt = mesh.uvs
+        self.vertices = vertices.to(device)
+        self.faces = faces.to(device)
         self.normalize_mesh(inplace=True, target_scale=0.6, dy=0.25)
 
     def normalize_mesh(self,inplace=False, target_scale=1, dy=0):
@@ -35,24 +48,59 @@ class Mesh:
         mesh.vertices = verts
         return mesh
 
-def compute_xatlas_texture_map(mesh):
+def atlas_cache_key(v_np, f_np, chart_options):
+    """ Content hash of a mesh and the xatlas chart options used to parameterize it
+
+    Args:
+        v_np (np.ndarray): V x 3 array of vertex positions
+        f_np (np.ndarray): F x 3 array of face indices
+        chart_options (dict): chart options passed to xatlas
+
+    Returns:
+        str: hexadecimal hash
+    """
+    h = hashlib.sha256()
+    for array in (np.ascontiguousarray(v_np, dtype=np.float32), np.ascontiguousarray(f_np, dtype=np.int32)):
+        h.update(str(array.shape).encode())
+        h.update(array.tobytes())
+    h.update(repr(sorted(chart_options.items())).encode())
+    h.update(str(getattr(xatlas, "__version__", "")).encode())
+    return h.hexdigest()
+
+def compute_xatlas_texture_map(mesh, cache_dir=None):
     device = mesh.vertices.device
     v_np = mesh.vertices.cpu().numpy()
     f_np = mesh.faces.int().cpu().numpy()
-    atlas = xatlas.Atlas()
-    atlas.add_mesh(v_np, f_np)
-    chart_options = xatlas.ChartOptions()
-    chart_options.max_iterations = 4
-    atlas.generate(chart_options=chart_options)
-    vmapping, ft_np, vt_np = atlas[0]  # [N], [M, 3], [N, 2]
+    options = {"max_iterations": 4}
+
+    # Load the atlas of an identical mesh if it was computed before
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, atlas_cache_key(v_np, f_np, options) + ".npz")
+    if cache_path is not None and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            vt_np, ft_np = cached["vt"], cached["ft"]
+    else:
+        atlas = xatlas.Atlas()
+        atlas.add_mesh(v_np, f_np)
+        chart_options = xatlas.ChartOptions()
+        for name, value in options.items():
+            setattr(chart_options, name, value)
+        atlas.generate(chart_options=chart_options)
+        vmapping, ft_np, vt_np = atlas[0]  # [N], [M, 3], [N, 2]
+        if cache_path is not None:
+            # Write to a temporary file first so that the cache never holds partial files
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vt=vt_np, ft=ft_np)
+            os.replace(tmp_path, cache_path)
     vt = torch.from_numpy(vt_np.astype(np.float32)).float().to(device)
     ft = torch.from_numpy(ft_np.astype(np.int64)).int().to(device)
     return vt, ft
 
-def compute_uv_map(mesh):
-    vt, ft = compute_xatlas_texture_map(mesh)
-    uvs = kal.ops.mesh.index_vertices_by_faces(
-        vt.unsqueeze(0),
-        ft.long()
-    ).detach()
+def compute_uv_map(mesh, cache_dir=None):
+    vt, ft = compute_xatlas_texture_map(mesh, cache_dir=cache_dir)
+    # 1 x F x 3 x 2 UVs of the face corners
+    uvs = vt[ft.long()].unsqueeze(0).detach()
     return uvs, vt, ft
\ No newline at end of file
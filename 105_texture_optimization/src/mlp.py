@@ -1,6 +1,7 @@
 import torch
 import torch.nn as nn
 from .positional_encoding import FourierFeatureTransform
+from .hash_grid_encoding import HashGridEncoding
 
 class MLP(nn.Module):
     def __init__(
@@ -12,11 +13,21 @@ class MLP(nn.Module):
         positional_encoding=True,
         sigma=12.0,
         clamp="sigmoid",
+        hash_grid=False,
+        num_levels=16,
+        log2_hashmap_size=16,
     ):
         super(MLP, self).__init__()
         self.clamp = clamp
         layers = []
-        if positional_encoding:
+        if hash_grid:
+            # Multiresolution hash encoding, meant to be used with a small network
+            encoding = HashGridEncoding(input_dim, num_levels=num_levels, log2_hashmap_size=log2_hashmap_size)
+            layers.append(encoding)
+            layers.append(nn.Linear(encoding.output_dim, width))
+            layers.append(nn.ReLU())
+            layers.append(nn.LayerNorm([width]))
+        elif positional_encoding:
             layers.append(FourierFeatureTransform(input_dim, width, sigma))
             layers.append(nn.Linear(width * 2 + input_dim, width))
             layers.append(nn.ReLU())
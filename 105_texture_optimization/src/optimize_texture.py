@@ -1,11 +1,16 @@
+import time
 import torch
-import torchvision
 from tqdm import tqdm
 from pathlib import Path
 
 from .mlp import MLP
 from .get_target_renders import get_target_renders
-from .bake_texture_map import bake_texture_map
+from .bake_texture_map import bake_texture_map, bake_texture_image
+from .result_writer import ResultWriter
+from .checkpoint import save_checkpoint, load_checkpoint
+from .sparse_texture import SparseTexture, compact_texels
+from .profiler import StageProfiler
+from .view_sampling import sample_uniform_views
 
 def optimize_texture(
     mesh,
@@ -19,7 +24,22 @@ def optimize_texture(
     lr=1e-4,
     target_texture="uv_grid",
     target_uvs=None,
-    device="cuda"
+    device="cuda",
+    async_logging=True,
+    log_frame_budget=None,
+    fast_step=False,
+    compile_step=False,
+    mlp=None,
+    results_dir="results",
+    hash_grid=False,
+    checkpoint_path=None,
+    checkpoint_every=100,
+    resume=False,
+    config=None,
+    sparse_texture=False,
+    profiler=None,
+    monitor=None,
+    view_sampler=None
 ):
     """ Optimize the texture map of a mesh
 
@@ -36,83 +56,224 @@ def optimize_texture(
         target_texture (str): Which texture to use for the target renders
         target_uvs (torch.Tensor): UV coordinates of the target mesh
         device (str): Device to run the optimization on
+        async_logging (bool): Write intermediate results on a background thread
+        log_frame_budget (float): Optional time in seconds that saving intermediate
+            results may take per logging step; snapshots over budget are dropped
+        fast_step (bool): Run the forward pass in mixed precision (bfloat16 on the CPU,
+            float16 on the GPU) and bake all channels with a single scatter into a
+            reusable background buffer
+        compile_step (bool): Compile the MLP forward and bake with `torch.compile()`
+            (if available)
+        mlp (MLP): Optional MLP to continue optimizing (a new one is created if None)
+        results_dir (str): Directory to save intermediate results to
+        hash_grid (bool): Use a multiresolution hash grid encoding with a small MLP head
+            instead of Fourier features with a 4x256 MLP (only used if `mlp` is None).
+            The hash grid usually needs a larger learning rate (e.g. 1e-2).
+        checkpoint_path (str): Optional path to periodically save the training state to
+        checkpoint_every (int): Number of iterations between checkpoints
+        resume (bool): Continue from `checkpoint_path` if it exists (a run that stopped
+            early is not continued)
+        config (dict): Settings that affect the result (target texture, resolutions,
+            iterations, ...), stored in the checkpoint. Resuming from a checkpoint saved
+            with other settings raises an error.
+        sparse_texture (bool): Only predict and store one value per covered texel
+            (see `SparseTexture`); the dense texture is created only for rendering
+        profiler (StageProfiler): Optional profiler timing the stages of every
+            iteration; `profiler.stop()` is called at the end of the optimization
+        monitor (ConvergenceMonitor): Optional monitor of the loss that stops the
+            optimization early once it converged
+        view_sampler (ImportanceViewSampler): Optional sampler drawing the camera
+            directions based on the recent per-view loss (uniform if None)
     
     Returns:
         mlp (MLP): Trained MLP used to predict RGB values over the mesh surface
         texture_image (torch.Tensor): Updated texture image
     """
     # Initialize directories to save results
-    Path("results/renders").mkdir(parents=True, exist_ok=True)
-    Path("results/textures").mkdir(parents=True, exist_ok=True)
+    Path(f"{results_dir}/renders").mkdir(parents=True, exist_ok=True)
+    Path(f"{results_dir}/textures").mkdir(parents=True, exist_ok=True)
+    writer = ResultWriter(frame_budget=log_frame_budget, asynchronous=async_logging)
 
     # Initialize our coordinate network mapping surface points to RGB colors
-    mlp = MLP(depth=4, width=256, out_dim=3, input_dim=3).to(device)
+    if mlp is None and hash_grid:
+        mlp = MLP(depth=1, width=64, out_dim=3, input_dim=3, hash_grid=True).to(device)
+    elif mlp is None:
+        mlp = MLP(depth=4, width=256, out_dim=3, input_dim=3).to(device)
 
     # Initialize our optimizer
     optim = torch.optim.Adam(mlp.parameters(), lr)
 
+    # Set up the (optional) fast step
+    device_type = torch.device(device).type
+    amp_dtype = torch.bfloat16 if device_type == "cpu" else torch.float16
+    scaler = torch.amp.GradScaler("cuda") if fast_step and device_type == "cuda" else None
+    H, W = texture_image.shape[2], texture_image.shape[3]
+    texture_background = texture_image[0].detach().reshape(3, -1).T.contiguous()
+    if sparse_texture:
+        surface_points, texel_indices = compact_texels(surface_points, texel_indices)
+        print(f"Optimizing {texel_indices.shape[0]} covered texels ({texel_indices.shape[0] / (H * W):.0%} of the texture)")
+
+    # Set up the (optional) profiler. A compiled MLP forward and bake is timed as a
+    # single stage, since timers cannot run inside the compiled function.
+    if profiler is None:
+        profiler = StageProfiler(device, enabled=False)
+    compiled = compile_step and hasattr(torch, "compile")
+    predict_profiler = StageProfiler(device, enabled=False) if compiled else profiler
+    compiled_profiler = profiler if compiled else StageProfiler(device, enabled=False)
+
+    def predict_texture(surface_points):
+        # Get MLP predictions for the RGB values
+        with predict_profiler.stage("mlp"):
+            pred_rgbs = mlp(surface_points)
+
+        # Bake the predicted RGBs into the texture map
+        with predict_profiler.stage("bake"):
+            if sparse_texture:
+                return SparseTexture(texel_indices, pred_rgbs, (H, W)).to_dense(texture_background)
+            if fast_step:
+                flat_texture = bake_texture_image(pred_rgbs, texel_indices, texture_background)
+                baked_texture_image = flat_texture.T.reshape(1, 3, H, W)
+            else:
+                baked_texture_image = torch.zeros_like(texture_image)
+                for channel in range(3):
+                    baked_texture_image[:, channel] = bake_texture_map(
+                                                            pred_rgbs[:, channel],
+                                                            texel_indices,
+                                                            texture_image[0, channel, :, :].clone().detach()
+                                                        )
+            return baked_texture_image.transpose(2, 3).flip(2)
+
+    if compiled:
+        predict_texture = torch.compile(predict_texture)
+
+    # Restore the training state of an interrupted run
+    start_iteration = 0
+    if resume and checkpoint_path is not None and Path(checkpoint_path).exists():
+        start_iteration, stopped = load_checkpoint(
+            checkpoint_path, mlp, optim, device, scaler=scaler, config=config,
+            monitor=monitor, view_sampler=view_sampler)
+        if stopped:
+            # Training further would not reproduce the result of the stopped run
+            print(f"The optimization stopped early at iteration {start_iteration}, not resuming it")
+            start_iteration = iterations
+        else:
+            print(f"Resuming from iteration {start_iteration}")
+
     # Optimize our texture map
-    for iteration in tqdm(range(iterations)):
+    start_time = time.perf_counter()
+    completed_iterations = 0
+    for iteration in tqdm(range(start_iteration, iterations)):
+        profiler.step(iteration)
+
         # Reset gradients
         optim.zero_grad()
 
-        # Get MLP predictions for the RGB values
-        pred_rgbs = mlp(surface_points)
+        with profiler.stage("cameras"):
+            # Randomly sample camera parameters (angles in radians)
+            if view_sampler is not None:
+                azim, elev, view_bins = view_sampler.sample(num_renders, device)
+            else:
+                azim, elev = sample_uniform_views(num_renders, device)
+            radius = torch.rand((num_renders,), device=device) + 1 # range is [1, 2]
 
-        # Bake the predicted RGBs into the texture map
-        baked_texture_image = torch.zeros_like(texture_image)
-        for channel in range(3):
-            baked_texture_image[:, channel] = bake_texture_map(
-                                                    pred_rgbs[:, channel],
-                                                    texel_indices,
-                                                    texture_image[0, channel, :, :].clone().detach()
-                                                )
-        texture_map = baked_texture_image.transpose(2, 3).flip(2)
-
-        # Randomly sample camera parameters (angles in radians)
-        azim = torch.deg2rad(torch.rand((num_renders,), device=device) * 360)
-        elev = torch.deg2rad(torch.rand((num_renders,), device=device) * 180 - 90)
-        radius = torch.rand((num_renders,), device=device) + 1 # range is [1, 2]
-
-        # Render the mesh with the new texture map
-        renders = renderer.render_texture(
-            mesh.vertices,
-            mesh.faces,
-            uvs,
-            texture_map,
-            azim=azim,
-            elev=elev,
-            radius=radius
-        )
-
-        # Compute the loss between the rendered image and the target image
-        target_renders = get_target_renders(
-            mesh,
-            renderer,
-            target_texture,
-            azim=azim,
-            elev=elev,
-            radius=radius,
-            uvs=target_uvs
-        )
-        loss = torch.nn.functional.mse_loss(renders, target_renders)
-
-        # Backpropagate gradients to parameters
-        loss.backward()
-
-        # Update parameters by taking a step in the direction indicated by the gradients
-        optim.step()
+            # Project the mesh once for these cameras; the renders and target renders share
+            # it. The geometry always stays in full precision.
+            views = renderer.prepare_views(mesh.vertices, mesh.faces, elev=elev, azim=azim, radius=radius)
+
+        with torch.autocast(device_type=device_type, dtype=amp_dtype, enabled=fast_step):
+            # Predict the texture map with the MLP
+            with compiled_profiler.stage("mlp + bake"):
+                texture_map = predict_texture(surface_points)
+
+            # Render the mesh with the new texture map
+            with profiler.stage("render"):
+                renders = renderer.render_texture(
+                    mesh.vertices,
+                    mesh.faces,
+                    uvs,
+                    texture_map,
+                    views=views
+                )
+
+            # Compute the loss between the rendered image and the target image
+            with profiler.stage("target render"):
+                target_renders = get_target_renders(
+                    mesh,
+                    renderer,
+                    target_texture,
+                    azim=azim,
+                    elev=elev,
+                    radius=radius,
+                    uvs=target_uvs,
+                    views=views
+                )
+            view_losses = torch.mean((renders.float() - target_renders.float()) ** 2, dim=(1, 2, 3))
+            loss = view_losses.mean()
+
+        # Backpropagate gradients to parameters and update parameters by taking a step
+        # in the direction indicated by the gradients
+        with profiler.stage("backward"):
+            if scaler is not None:
+                scaler.scale(loss).backward()
+            else:
+                loss.backward()
+        with profiler.stage("optimizer"):
+            if scaler is not None:
+                scaler.step(optim)
+                scaler.update()
+            else:
+                optim.step()
+
+        # Sample the views with a high loss more often and check for convergence
+        if view_sampler is not None:
+            view_sampler.update(view_bins, view_losses)
+        stop = monitor is not None and monitor.update(loss.item())
 
         # Log results
-        if iteration % 100 == 0:
-            # Log the loss
-            print(f"Iteration: {iteration}, Loss: {loss.item()}")
-        if iteration % 25 == 0:
-            # Save the rendered image
-            torchvision.utils.save_image(renders, f"results/renders/iter_{iteration}.png")
-            # Save the texture map
-            torchvision.utils.save_image(texture_map, f"results/textures/texture_map_{iteration}.png")
-            # Save the target renders
-            # torchvision.utils.save_image(target_renders, f"results/target_renders_{iteration}.png")
+        with profiler.stage("logging"):
+            if iteration % 100 == 0:
+                # Log the loss
+                print(f"Iteration: {iteration}, Loss: {loss.item()}")
+            if iteration % 25 == 0:
+                # Save the rendered image
+                writer.save_image(renders, f"{results_dir}/renders/iter_{iteration}.png")
+                # Save the texture map
+                writer.save_image(texture_map, f"{results_dir}/textures/texture_map_{iteration}.png")
+                # Save the target renders
+                # writer.save_image(target_renders, f"{results_dir}/target_renders_{iteration}.png")
+
+        # Save the training state
+        if checkpoint_path is not None and (
+            (iteration + 1) % checkpoint_every == 0 or iteration + 1 == iterations or stop
+        ):
+            with profiler.stage("checkpoint"):
+                save_checkpoint(
+                    checkpoint_path, mlp, optim, iteration + 1, scaler=scaler, config=config,
+                    monitor=monitor, view_sampler=view_sampler, stopped=stop)
+
+        completed_iterations = iteration + 1 - start_iteration
+        if stop:
+            print(f"Stopping early after iteration {iteration}: {monitor.reason}")
+            break
+
+    # Report the optimization speed
+    if device_type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start_time
+    if completed_iterations > 0:
+        print(f"Optimized {completed_iterations} iterations in {elapsed:.1f}s ({completed_iterations / elapsed:.2f} iterations/s)")
+
+    # Bake the texture map of the final weights. The one of the last iteration was
+    # predicted before its optimizer step, and a completed checkpoint has none.
+    with torch.no_grad():
+        texture_map = predict_texture(surface_points)
+
+    # Wait for the remaining intermediate results to be written
+    writer.close()
+    if writer.num_dropped > 0:
+        print(f"Dropped {writer.num_dropped} intermediate results to keep up with the optimization")
+
+    # Print the time spent per stage and write the trace
+    profiler.stop()
 
     return mlp, texture_map
\ No newline at end of file
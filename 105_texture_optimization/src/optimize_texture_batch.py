@@ -0,0 +1,203 @@
+import time
+import torch
+from tqdm import tqdm
+from pathlib import Path
+
+from .mlp import MLP
+from .mesh import compute_uv_map
+from .render import pad_faces
+from .bake_texture_map import bake_texture_image
+from .result_writer import ResultWriter
+
+def pack_surface_points(surface_points, texel_indices, num_texels):
+    """ Pack the surface points of several meshes into one tensor
+
+    Args:
+        surface_points (list): M tensors of surface points of shape (N_m, 3)
+        texel_indices (list): M tensors of texel indices of shape (N_m,)
+        num_texels (int): number of texels of every texture image (H*W)
+
+    Returns:
+        points (torch.Tensor): all surface points of shape (N, 3)
+        indices (torch.Tensor): texel indices into the stacked textures of shape (N,);
+            the texels of mesh m start at m*num_texels
+        mesh_ids (torch.Tensor): index of the mesh of every point of shape (N,)
+        offsets (torch.Tensor): index of the first point of every mesh of shape (M+1,)
+    """
+    device = surface_points[0].device
+    counts = torch.tensor([p.shape[0] for p in surface_points], device=device)
+    offsets = torch.nn.functional.pad(torch.cumsum(counts, 0), (1, 0))
+    mesh_ids = torch.repeat_interleave(torch.arange(len(surface_points), device=device), counts)
+    points = torch.cat(surface_points)
+    indices = torch.cat(texel_indices).long() + mesh_ids * num_texels
+    return points, indices, mesh_ids, offsets
+
+def optimize_texture_batch(
+    meshes,
+    surface_points,
+    texel_indices,
+    uvs,
+    texture_images,
+    renderer,
+    num_renders=3,
+    iterations=2000,
+    lr=1e-4,
+    target_textures="uv_grid",
+    target_uvs=None,
+    device="cuda",
+    async_logging=True,
+    log_frame_budget=None,
+    mlp=None,
+    results_dir="results/batch",
+    hash_grid=False
+):
+    """ Optimize the texture maps of several meshes at once
+
+    The surface points of all meshes are packed into one tensor and go through a
+    single MLP forward. The MLP has one RGB output head per mesh. Every iteration
+    renders the same random views of all meshes in one batched call.
+
+    Args:
+        meshes (list): M Mesh objects
+        surface_points (list): M tensors of surface points
+        texel_indices (list): M tensors of texel indices
+        uvs (list): M tensors of UV coordinates
+        texture_images (list): M texture images, all of the same size
+        renderer (Renderer): Renderer object
+        num_renders (int): Number of renders per mesh to use for optimization
+        iterations (int): Number of optimization iterations
+        lr (float): Learning rate
+        target_textures (list): M target texture images of the same size, or one image
+            for all meshes
+        target_uvs (list): M tensors of UV coordinates of the target meshes (computed
+            with XAtlas if None)
+        device (str): Device to run the optimization on
+        async_logging (bool): Write intermediate results on a background thread
+        log_frame_budget (float): Optional time in seconds that saving intermediate
+            results may take per logging step; snapshots over budget are dropped
+        mlp (MLP): Optional MLP with 3*M outputs to continue optimizing
+        results_dir (str): Directory to save intermediate results to
+        hash_grid (bool): Use a multiresolution hash grid encoding with a small MLP head
+            (only used if `mlp` is None)
+
+    Returns:
+        mlp (MLP): Trained MLP predicting the RGB values of all meshes
+        texture_images (list): M updated texture images
+    """
+    # Initialize directories to save results
+    Path(f"{results_dir}/renders").mkdir(parents=True, exist_ok=True)
+    Path(f"{results_dir}/textures").mkdir(parents=True, exist_ok=True)
+    writer = ResultWriter(frame_budget=log_frame_budget, asynchronous=async_logging)
+
+    M = len(meshes)
+    for name, values in (("surface_points", surface_points), ("texel_indices", texel_indices),
+                         ("uvs", uvs), ("texture_images", texture_images)):
+        assert len(values) == M, f"Expected one entry of {name} per mesh (got {len(values)} for {M} meshes)"
+    # The textures are stacked into single tensors, so they need the same size
+    shapes = {tuple(image.shape[-2:]) for image in texture_images}
+    assert len(shapes) == 1, f"Expected texture images of the same size (got sizes {sorted(shapes)})"
+    H, W = shapes.pop()
+
+    # Pack the inputs of all meshes
+    points, indices, mesh_ids, offsets = pack_surface_points(surface_points, texel_indices, H * W)
+    texture_background = torch.cat(
+        [image.detach().reshape(3, -1).T for image in texture_images]).contiguous()
+    point_range = torch.arange(points.shape[0], device=points.device)
+
+    # Pad the UVs of all meshes to the same number of faces and repeat them per view
+    if target_uvs is None:
+        target_uvs = [compute_uv_map(mesh)[0] for mesh in meshes]
+    num_faces = max(mesh.faces.shape[0] for mesh in meshes)
+    def batch_uvs(uvs):
+        uvs = [pad_faces(uv.reshape(1, -1, 3, 2), num_faces) for uv in uvs]
+        return torch.cat(uvs).repeat_interleave(num_renders, dim=0)
+    # The renderer caches the rasterization per UV tensor: with the same UVs for the
+    # renders and the target renders, every iteration only rasterizes once
+    same_uvs = all(target is uv for target, uv in zip(target_uvs, uvs))
+    uvs = batch_uvs(uvs)
+    target_uvs = uvs if same_uvs else batch_uvs(target_uvs)
+    if not isinstance(target_textures, (list, tuple)):
+        target_textures = [target_textures] * M
+    assert len(target_textures) == M, \
+        f"Expected one target texture per mesh (got {len(target_textures)} for {M} meshes)"
+    target_shapes = {tuple(texture.shape[-2:]) for texture in target_textures}
+    assert len(target_shapes) == 1, \
+        f"Expected target textures of the same size (got sizes {sorted(target_shapes)}); resize them first"
+    target_textures = torch.stack(
+        [texture.reshape(3, texture.shape[-2], texture.shape[-1]) for texture in target_textures]
+    ).repeat_interleave(num_renders, dim=0)
+
+    # Initialize our coordinate network with one RGB head per mesh
+    if mlp is None and hash_grid:
+        mlp = MLP(depth=1, width=64, out_dim=3 * M, input_dim=3, hash_grid=True).to(device)
+    elif mlp is None:
+        mlp = MLP(depth=4, width=256, out_dim=3 * M, input_dim=3).to(device)
+
+    # Initialize our optimizer
+    optim = torch.optim.Adam(mlp.parameters(), lr)
+
+    def predict_textures():
+        # Predict the RGB values of all meshes and keep the head of each point's mesh
+        pred_rgbs = mlp(points).view(-1, M, 3)[point_range, mesh_ids]
+
+        # Bake the predicted RGBs into the stacked texture maps
+        flat_textures = bake_texture_image(pred_rgbs, indices, texture_background)
+        textures = flat_textures.reshape(M, H * W, 3).permute(0, 2, 1).reshape(M, 3, H, W)
+        return textures.transpose(2, 3).flip(2)
+
+    # Optimize our texture maps
+    start_time = time.perf_counter()
+    for iteration in tqdm(range(iterations)):
+        # Reset gradients
+        optim.zero_grad()
+
+        # Randomly sample camera parameters (angles in radians), shared by all meshes
+        azim = torch.deg2rad(torch.rand((num_renders,), device=device) * 360)
+        elev = torch.deg2rad(torch.rand((num_renders,), device=device) * 180 - 90)
+        radius = torch.rand((num_renders,), device=device) + 1 # range is [1, 2]
+        views = renderer.prepare_batch_views(meshes, elev=elev, azim=azim, radius=radius)
+
+        # Predict the texture maps with the MLP
+        texture_maps = predict_textures()
+
+        # Render all meshes with their new texture maps
+        renders = renderer.render_texture(
+            None,
+            None,
+            uvs,
+            texture_maps.repeat_interleave(num_renders, dim=0),
+            views=views
+        )
+
+        # Compute the loss between the rendered images and the target images
+        with torch.no_grad():
+            target_renders = renderer.render_texture(None, None, target_uvs, target_textures, views=views)
+        loss = torch.nn.functional.mse_loss(renders, target_renders)
+
+        # Backpropagate gradients to parameters and update parameters
+        loss.backward()
+        optim.step()
+
+        # Log results
+        if iteration % 100 == 0:
+            print(f"Iteration: {iteration}, Loss: {loss.item()}")
+        if iteration % 25 == 0:
+            writer.save_image(renders, f"{results_dir}/renders/iter_{iteration}.png")
+            writer.save_image(texture_maps, f"{results_dir}/textures/texture_map_{iteration}.png")
+
+    # Report the optimization speed
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start_time
+    if iterations > 0:
+        print(f"Optimized {M} meshes for {iterations} iterations in {elapsed:.1f}s ({iterations / elapsed:.2f} iterations/s)")
+
+    with torch.no_grad():
+        texture_maps = predict_textures()
+
+    # Wait for the remaining intermediate results to be written
+    writer.close()
+    if writer.num_dropped > 0:
+        print(f"Dropped {writer.num_dropped} intermediate results to keep up with the optimization")
+
+    return mlp, [texture_map.unsqueeze(0) for texture_map in texture_maps]
@@ -0,0 +1,124 @@
+import json
+import time
+import contextlib
+import torch
+from pathlib import Path
+
+class StageProfiler:
+    """
+    Lightweight timers for the stages of an optimization loop (MLP forward, bake,
+    render, ...). Stages are only timed every `record_every` iterations; the device is
+    synchronized before and after a timed stage so that asynchronous GPU work is
+    attributed to the right stage. The peak memory of a stage is only recorded on
+    CUDA devices. When disabled, `stage()` does nothing.
+
+    Usage:
+        profiler = StageProfiler("cuda", trace_path="results/trace.json")
+        for iteration in range(iterations):
+            profiler.step(iteration)
+            with profiler.stage("render"):
+                ...
+        profiler.stop()
+
+    Args:
+        device (str): device the stages run on
+        enabled (bool): whether to time the stages at all
+        record_every (int): number of iterations between timed iterations
+        torch_profiler (bool): also run `torch.profiler` for a few iterations; its
+            trace (with the stages as labeled ranges) is written instead of ours
+        trace_path (str): optional path of a Chrome trace JSON (chrome://tracing or
+            https://ui.perfetto.dev) written by `stop()`
+    """
+    def __init__(self, device="cpu", enabled=True, record_every=10, torch_profiler=False, trace_path=None):
+        self.device_type = torch.device(device).type
+        self.enabled = enabled
+        self.record_every = record_every
+        self.trace_path = trace_path
+        self.times = {}
+        self.peak_memory = {}
+        self.events = []
+        self._recording = False
+        self._start_time = time.perf_counter()
+        self._torch_profiler = None
+        if enabled and torch_profiler:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device_type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=1, warmup=1, active=3, repeat=1),
+                profile_memory=True
+            )
+            self._torch_profiler.start()
+
+    def _synchronize(self):
+        if self.device_type == "cuda":
+            torch.cuda.synchronize()
+
+    def step(self, iteration):
+        """ Mark the start of an iteration """
+        if not self.enabled:
+            return
+        if self._torch_profiler is not None and iteration > 0:
+            self._torch_profiler.step()
+        self._recording = iteration % self.record_every == 0
+
+    def stage(self, name):
+        """ Context manager timing one stage of the current iteration """
+        if self._recording:
+            return self._timed_stage(name)
+        if self._torch_profiler is not None:
+            return torch.profiler.record_function(name)
+        return contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def _timed_stage(self, name):
+        self._synchronize()
+        if self.device_type == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        start = time.perf_counter()
+        with torch.profiler.record_function(name):
+            yield
+        self._synchronize()
+        end = time.perf_counter()
+
+        self.times.setdefault(name, []).append(end - start)
+        if self.device_type == "cuda":
+            self.peak_memory[name] = max(self.peak_memory.get(name, 0), torch.cuda.max_memory_allocated())
+        # Chrome trace "complete" event, times in microseconds
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._start_time) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": 0,
+            "tid": 0,
+        })
+
+    def summary(self):
+        """ Table of the total and mean time and peak memory of every stage """
+        total = sum(sum(times) for times in self.times.values())
+        lines = [f"{'stage':<16}{'calls':>8}{'total (s)':>12}{'mean (ms)':>12}{'share':>8}{'peak (MB)':>12}"]
+        for name, times in sorted(self.times.items(), key=lambda item: -sum(item[1])):
+            peak = f"{self.peak_memory[name] / 2**20:.1f}" if name in self.peak_memory else "-"
+            lines.append(
+                f"{name:<16}{len(times):>8}{sum(times):>12.3f}{1000 * sum(times) / len(times):>12.2f}"
+                f"{sum(times) / max(total, 1e-12):>8.0%}{peak:>12}"
+            )
+        return "\n".join(lines)
+
+    def stop(self):
+        """ Stop profiling, write the trace and print the summary table """
+        if not self.enabled:
+            return
+        if self._torch_profiler is not None:
+            self._torch_profiler.stop()
+        if self.trace_path is not None:
+            Path(self.trace_path).parent.mkdir(parents=True, exist_ok=True)
+            if self._torch_profiler is not None:
+                self._torch_profiler.export_chrome_trace(self.trace_path)
+            else:
+                with open(self.trace_path, "w") as f:
+                    json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        if self.times:
+            print(self.summary())
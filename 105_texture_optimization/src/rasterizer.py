@@ -0,0 +1,280 @@
+import torch
+import numpy as np
+
+
+def perspective_projection(fovyangle, ratio=1.0):
+    """ Perspective projection of a pinhole camera (same convention as kaolin)
+
+    Args:
+        fovyangle (float): field of view angle along the y axis in radians
+        ratio (float): aspect ratio (width / height)
+
+    Returns:
+        camera_proj (torch.Tensor): 3 x 1 projection
+    """
+    tanfov = np.tan(fovyangle / 2)
+    return torch.tensor([[1.0 / (ratio * tanfov)], [1.0 / tanfov], [-1.0]], dtype=torch.float)
+
+
+def look_at_transform(camera_position, look_at, camera_up_direction):
+    """ Camera transformation looking from `camera_position` at `look_at`
+    (same convention as kaolin)
+
+    Args:
+        camera_position (torch.Tensor): B x 3 camera positions
+        look_at (torch.Tensor): B x 3 points the cameras look at
+        camera_up_direction (torch.Tensor): B x 3 up directions
+
+    Returns:
+        camera_transform (torch.Tensor): B x 4 x 3 transformation matrices
+    """
+    z_axis = camera_position - look_at
+    z_axis = z_axis / torch.linalg.norm(z_axis, dim=1, keepdim=True)
+    x_axis = torch.cross(camera_up_direction, z_axis, dim=1)
+    x_axis = x_axis / torch.linalg.norm(x_axis, dim=1, keepdim=True)
+    y_axis = torch.cross(z_axis, x_axis, dim=1)
+    rot_part = torch.stack([x_axis, y_axis, z_axis], dim=2)
+    trans_part = -camera_position.unsqueeze(1) @ rot_part
+    return torch.cat([rot_part, trans_part], dim=1)
+
+
+class KaolinRasterizer:
+    """ Rasterizer backend using kaolin (requires a CUDA build of kaolin) """
+    def __init__(self):
+        import kaolin as kal
+        self.kal = kal
+
+    def prepare_vertices(self, verts, faces, camera_proj, camera_transform):
+        return self.kal.render.mesh.prepare_vertices(
+            verts, faces, camera_proj, camera_transform=camera_transform)
+
+    def rasterize(self, height, width, face_vertices_z, face_vertices_image, face_features):
+        return self.kal.render.mesh.rasterize(
+            height, width, face_vertices_z, face_vertices_image, face_features)
+
+    def texture_mapping(self, texture_coordinates, texture_maps, mode='nearest'):
+        return self.kal.render.mesh.texture_mapping(texture_coordinates, texture_maps, mode=mode)
+
+    def spherical_harmonic_lighting(self, image_normals, lights):
+        return self.kal.render.mesh.spherical_harmonic_lighting(image_normals, lights)
+
+
+class TorchRasterizer:
+    """ Vectorized rasterizer backend written in pure PyTorch (runs on the CPU)
+
+    Triangles are binned into square screen tiles. Each (triangle, tile) pair tests all
+    pixels of its tile and the closest triangle per pixel is kept with a z-buffer. The
+    features are then interpolated with barycentric coordinates recomputed for the
+    visible triangle only, so gradients flow to the features (e.g. UVs) and through
+    `texture_mapping()` to the texture.
+
+    Args:
+        tile_size (int): side length in pixels of the screen tiles
+        max_chunk_pixels (int): maximum number of (triangle, pixel) tests done at once;
+            lower this to reduce memory usage
+    """
+    def __init__(self, tile_size=16, max_chunk_pixels=2**22):
+        self.tile_size = tile_size
+        self.max_chunk_pixels = max_chunk_pixels
+
+    def prepare_vertices(self, verts, faces, camera_proj, camera_transform):
+        # Transform the vertices to camera space
+        padded_verts = torch.nn.functional.pad(verts, (0, 1), value=1.0)
+        verts_camera = padded_verts @ camera_transform
+        # Project onto the image plane
+        verts_image = verts_camera * camera_proj.view(1, 1, 3)
+        verts_image = verts_image[:, :, :2] / verts_image[:, :, 2:3]
+
+        face_vertices_camera = verts_camera[:, faces]
+        face_vertices_image = verts_image[:, faces]
+        face_normals = torch.cross(
+            face_vertices_camera[:, :, 1] - face_vertices_camera[:, :, 0],
+            face_vertices_camera[:, :, 2] - face_vertices_camera[:, :, 0],
+            dim=-1
+        )
+        face_normals = face_normals / torch.linalg.norm(face_normals, dim=-1, keepdim=True)
+        return face_vertices_camera, face_vertices_image, face_normals
+
+    def rasterize(self, height, width, face_vertices_z, face_vertices_image, face_features):
+        """ Rasterize triangles
+
+        Args:
+            height (int): image height
+            width (int): image width
+            face_vertices_z (torch.Tensor): B x F x 3 camera space depth of the face
+                vertices (the camera looks along -z, larger is closer)
+            face_vertices_image (torch.Tensor): B x F x 3 x 2 face vertices in
+                normalized image coordinates ([-1, 1], y pointing up)
+            face_features (torch.Tensor): B x F x 3 x D per-corner features
+
+        Returns:
+            features (torch.Tensor): B x H x W x D interpolated features
+            face_idx (torch.Tensor): B x H x W index of the visible face (-1 if none)
+        """
+        device = face_vertices_image.device
+        B, F = face_vertices_z.shape[:2]
+        T = self.tile_size
+
+        # Vertices in pixel coordinates (pixel centers at integer positions)
+        with torch.no_grad():
+            px = (face_vertices_image[..., 0].float() + 1) * (width / 2) - 0.5
+            py = (1 - face_vertices_image[..., 1].float()) * (height / 2) - 0.5
+            tris = torch.stack((px, py), dim=-1).reshape(B * F, 3, 2)
+            z = face_vertices_z.float().reshape(B * F, 3)
+
+            # Pixel bounding box of each face
+            xmin = torch.ceil(tris[:, :, 0].min(dim=1).values).clamp(0, width - 1).long()
+            xmax = torch.floor(tris[:, :, 0].max(dim=1).values).clamp(0, width - 1).long()
+            ymin = torch.ceil(tris[:, :, 1].min(dim=1).values).clamp(0, height - 1).long()
+            ymax = torch.floor(tris[:, :, 1].max(dim=1).values).clamp(0, height - 1).long()
+            area = edge_function(tris[:, 0], tris[:, 1], tris[:, 2])
+            visible = (xmin <= xmax) & (ymin <= ymax) & (area != 0) & torch.isfinite(area)
+
+            # Bin faces into the screen tiles overlapped by their bounding boxes
+            tx0, ty0 = xmin // T, ymin // T
+            ntx = torch.where(visible, xmax // T - tx0 + 1, 0)
+            nty = torch.where(visible, ymax // T - ty0 + 1, 0)
+            counts = ntx * nty
+            pair_face = torch.repeat_interleave(torch.arange(B * F, device=device), counts)
+            pair_local = torch.arange(pair_face.shape[0], device=device) - \
+                torch.repeat_interleave(torch.cumsum(counts, 0) - counts, counts)
+            pair_tx = tx0[pair_face] + pair_local % ntx[pair_face]
+            pair_ty = ty0[pair_face] + pair_local // ntx[pair_face]
+
+            # Pixel offsets within a tile
+            offset_y, offset_x = torch.meshgrid(
+                torch.arange(T, device=device), torch.arange(T, device=device), indexing='ij')
+            offset_x, offset_y = offset_x.flatten(), offset_y.flatten()
+
+            # Test all pixels of each (face, tile) pair and keep the fragments inside
+            zbuffer = torch.full((B * height * width,), -torch.inf, dtype=z.dtype, device=device)
+            # Start with empty fragments, so that views without visible faces also work
+            fragments_pixel = [torch.zeros(0, dtype=torch.long, device=device)]
+            fragments_face = [torch.zeros(0, dtype=torch.long, device=device)]
+            fragments_z = [torch.zeros(0, dtype=z.dtype, device=device)]
+            chunk = max(1, self.max_chunk_pixels // (T * T))
+            for start in range(0, pair_face.shape[0], chunk):
+                face = pair_face[start:start + chunk]
+                x = pair_tx[start:start + chunk, None] * T + offset_x[None]
+                y = pair_ty[start:start + chunk, None] * T + offset_y[None]
+                inside = (x >= xmin[face, None]) & (x <= xmax[face, None]) & \
+                    (y >= ymin[face, None]) & (y <= ymax[face, None])
+                p = torch.stack((x, y), dim=-1).to(tris.dtype)
+                w = barycentric_coords(tris[face, None], p)
+                inside &= torch.all(w >= 0, dim=-1)
+                depth = torch.sum(w * z[face, None], dim=-1)
+
+                face = face[:, None].expand_as(x)[inside]
+                pixel = (face // F) * height * width + y[inside] * width + x[inside]
+                depth = depth[inside]
+                zbuffer.scatter_reduce_(0, pixel, depth, reduce='amax')
+                fragments_pixel.append(pixel)
+                fragments_face.append(face)
+                fragments_z.append(depth)
+
+            # Resolve the closest face per pixel
+            pixel = torch.cat(fragments_pixel)
+            face = torch.cat(fragments_face)
+            closest = torch.cat(fragments_z) == zbuffer[pixel]
+            face_buffer = torch.full((B * height * width,), -1, dtype=torch.long, device=device)
+            face_buffer.scatter_reduce_(0, pixel[closest], face[closest], reduce='amax')
+            covered = torch.nonzero(face_buffer >= 0).squeeze(1)
+            covered_face = face_buffer[covered]
+            face_idx = torch.where(face_buffer >= 0, face_buffer % F, -1).reshape(B, height, width)
+
+        # Interpolate the features of the visible faces (differentiable)
+        pixel_x = (covered % width).to(face_vertices_image.dtype)
+        pixel_y = ((covered // width) % height).to(face_vertices_image.dtype)
+        points = torch.stack((
+            (2 * pixel_x + 1) / width - 1,
+            1 - (2 * pixel_y + 1) / height
+        ), dim=-1)
+        w = barycentric_coords(face_vertices_image.reshape(B * F, 3, 2)[covered_face], points)
+        D = face_features.shape[-1]
+        # Elementwise ops so that the interpolation stays in full precision under autocast
+        covered_features = torch.sum(
+            w[..., None] * face_features.reshape(B * F, 3, D)[covered_face], dim=1)
+        features = torch.zeros(B * height * width, D, dtype=face_features.dtype, device=device)
+        features = features.index_put((covered,), covered_features)
+        return features.reshape(B, height, width, D), face_idx
+
+    def texture_mapping(self, texture_coordinates, texture_maps, mode='nearest'):
+        """ Sample texture maps at UV coordinates
+
+        Args:
+            texture_coordinates (torch.Tensor): B x H x W x 2 UV coordinates
+            texture_maps (torch.Tensor): B x C x Ht x Wt texture images
+            mode (str): interpolation mode ('nearest', 'bilinear' or 'bicubic')
+
+        Returns:
+            torch.Tensor: B x H x W x C sampled features
+        """
+        # UV (0, 0) is the bottom left of the texture image
+        grid = torch.stack((
+            texture_coordinates[..., 0] * 2 - 1,
+            1 - texture_coordinates[..., 1] * 2
+        ), dim=-1)
+        sampled = torch.nn.functional.grid_sample(
+            texture_maps, grid, mode=mode, padding_mode='border', align_corners=False)
+        return sampled.permute(0, 2, 3, 1)
+
+    def spherical_harmonic_lighting(self, image_normals, lights):
+        x, y, z = image_normals[..., 0], image_normals[..., 1], image_normals[..., 2]
+        bands = torch.stack([
+            0.2820948 * torch.ones_like(x),
+            -0.3257350 * y,
+            0.3257350 * z,
+            -0.3257350 * x,
+            0.2731371 * (x * y),
+            -0.2731371 * (y * z),
+            0.0788479 * (3 * z * z - 1),
+            -0.2731371 * (x * z),
+            0.1365686 * (x * x - y * y),
+        ], dim=-1)
+        return torch.sum(bands * lights.view(-1, 1, 1, 9), dim=-1)
+
+
+RASTERIZERS = {
+    "kaolin": KaolinRasterizer,
+    "torch": TorchRasterizer,
+}
+
+
+def get_rasterizer(name):
+    """ Create a rasterizer backend by name ("kaolin" or "torch") """
+    if name not in RASTERIZERS:
+        raise ValueError(f"{name} rasterizer not implemented. Choose one of {list(RASTERIZERS)}.")
+    return RASTERIZERS[name]()
+
+
+def edge_function(a, b, p):
+    """ Twice the signed area of the triangles (a, b, p): positive if p lies to the left of
+    the edge a -> b (counter-clockwise order for y pointing up)
+
+    Args:
+        a (torch.Tensor): ... x 2 edge starts
+        b (torch.Tensor): ... x 2 edge ends
+        p (torch.Tensor): ... x 2 points
+
+    Returns:
+        torch.Tensor: ... signed areas
+    """
+    return (b[..., 0] - a[..., 0]) * (p[..., 1] - a[..., 1]) - \
+        (b[..., 1] - a[..., 1]) * (p[..., 0] - a[..., 0])
+
+
+def barycentric_coords(triangles, points):
+    """ Barycentric coordinates of points with respect to 2D triangles
+
+    Args:
+        triangles (torch.Tensor): ... x 3 x 2 triangle corners
+        points (torch.Tensor): ... x 2 points (broadcast against the triangles)
+
+    Returns:
+        torch.Tensor: ... x 3 barycentric coordinates
+    """
+    a, b, c = triangles[..., 0, :], triangles[..., 1, :], triangles[..., 2, :]
+    area = edge_function(a, b, c)
+    w0 = edge_function(b, c, points) / area
+    w1 = edge_function(c, a, points) / area
+    return torch.stack((w0, w1, 1 - w0 - w1), dim=-1)
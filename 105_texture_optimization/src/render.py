@@ -1,6 +1,6 @@
-import kaolin as kal
 import torch
 import numpy as np
+from .rasterizer import get_rasterizer, perspective_projection, look_at_transform
 
 class Renderer:
     def __init__(
@@ -10,12 +10,15 @@ class Renderer:
         interpolation_mode='nearest',
         # Light Tensor (positive first): [ambient, right/left, front/back, top/bottom, ...]
         lights=torch.tensor([1.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0, 0.0, 0.0]),
+        # Either "kaolin" (CUDA), "torch" (pure PyTorch, runs on the CPU) or a rasterizer object
+        rasterizer="kaolin",
     ):
         assert interpolation_mode in ['nearest', 'bilinear', 'bicubic'], f'no interpolation mode {interpolation_mode}'
 
-        camera = kal.render.camera.generate_perspective_projection(np.pi / 3).to(device)
+        camera = perspective_projection(np.pi / 3).to(device)
 
         self.device = device
+        self.rasterizer = get_rasterizer(rasterizer) if isinstance(rasterizer, str) else rasterizer
         self.interpolation_mode = interpolation_mode
         self.camera_projection = camera
         self.dim = dim
@@ -49,15 +52,26 @@ class Renderer:
         look_at[:, 1] = look_at_height
 
         up = torch.tensor([0.0, 1.0, 0.0]).unsqueeze(0).repeat(B, 1).to(device)
-        camera_proj = kal.render.camera.generate_transformation_matrix(pos, look_at, up).to(device)
+        camera_proj = look_at_transform(pos, look_at, up).to(device)
         return camera_proj
 
-    def render_texture(
-        self, verts, faces, uv_face_attr, texture_map,
-        elev=None, azim=None, radius=None, look_at_height=0.0,
-        dims=None, white_background=False, lighting=False, lights=None,
-        tile=False, shader_style=False
-    ):
+    def prepare_views(self, verts, faces, elev=None, azim=None, radius=None, look_at_height=0.0):
+        """
+        Compute the camera transforms and projected face vertices of a mesh for a fixed
+        set of views. The result can be passed to `render_texture()` to render the same
+        mesh and views with different textures without redoing the geometry processing.
+
+        Args:
+            verts (torch.Tensor): V x 3 vertex positions
+            faces (torch.Tensor): F x 3 face indices
+            elev (torch.Tensor): B elevations
+            azim (torch.Tensor): B azimuths
+            radius (torch.Tensor): B (or 1) camera distances
+            look_at_height (float): height of the point the cameras look at
+
+        Returns:
+            ViewSet: cached geometry of the mesh seen from the B views
+        """
         if elev is None:
             elev = torch.Tensor([0, 0, 0]).to(self.device)
         if azim is None:
@@ -65,16 +79,86 @@ class Renderer:
         if radius is None:
             radius = torch.Tensor([3]*elev.shape[0]).to(self.device)
 
+        camera_transform = self.get_camera_from_view(elev, azim, r=radius, look_at_height=look_at_height).to(self.device)
+        face_vertices_camera, face_vertices_image, face_normals = self.rasterizer.prepare_vertices(
+            verts.to(self.device), faces.to(self.device), self.camera_projection, camera_transform)
+        return ViewSet(camera_transform, face_vertices_camera, face_vertices_image, face_normals)
+
+    def prepare_batch_views(self, meshes, elev=None, azim=None, radius=None, look_at_height=0.0):
+        """
+        Prepare the same views for several meshes so that all of them are rendered in a
+        single batched call. The faces of every mesh are padded with degenerate faces to
+        the largest face count, which are never rasterized.
+
+        Args:
+            meshes (list): M Mesh objects
+            elev (torch.Tensor): V elevations
+            azim (torch.Tensor): V azimuths
+            radius (torch.Tensor): V (or 1) camera distances
+            look_at_height (float): height of the point the cameras look at
+
+        Returns:
+            ViewSet: cached geometry of M*V views, ordered mesh by mesh
+        """
+        views = [self.prepare_views(mesh.vertices, mesh.faces, elev, azim, radius, look_at_height) for mesh in meshes]
+        num_faces = max(v.face_vertices_image.shape[1] for v in views)
+        return ViewSet(
+            torch.cat([v.camera_transform for v in views]),
+            torch.cat([pad_faces(v.face_vertices_camera, num_faces) for v in views]),
+            torch.cat([pad_faces(v.face_vertices_image, num_faces) for v in views]),
+            torch.cat([pad_faces(v.face_normals, num_faces) for v in views])
+        )
+
+    def rasterize_views(self, views, uv_face_attr, dims=None):
+        """
+        Rasterize the UVs of a mesh for a set of views. Results are cached on the view
+        set, so rendering the same UVs again (e.g. with a new texture) is free.
+
+        Args:
+            views (ViewSet): views created with `prepare_views()`
+            uv_face_attr (torch.Tensor): 1 x F x 3 x 2 per-corner UV coordinates, or
+                B x F x 3 x 2 for a different UV set per view
+            dims (tuple): output image dimensions
+
+        Returns:
+            uv_features (torch.Tensor): B x H x W x 2 interpolated UVs
+            face_idx (torch.Tensor): B x H x W index of the visible face (-1 if none)
+        """
         dims = self.dim if dims is None else dims
-        B = elev.shape[0]
-        lights = self.lights.repeat(B, 1) if lights is None else lights
+        key = (id(uv_face_attr), dims[0], dims[1])
+        if key in views.rasterized and views.rasterized[key][0] is uv_face_attr:
+            return views.rasterized[key][1:]
 
-        camera_transform = self.get_camera_from_view(elev, azim, r=radius, look_at_height=look_at_height).to(self.device)
-        face_vertices_camera, face_vertices_image, face_normals = kal.render.mesh.prepare_vertices(
-            verts.to(self.device), faces.to(self.device), self.camera_projection, camera_transform=camera_transform)
+        B = len(views)
+        if uv_face_attr.dim() < 4 or uv_face_attr.shape[0] != B:
+            uv_face_attr_batch = uv_face_attr.repeat(B, 1, 1, 1)
+        else:
+            uv_face_attr_batch = uv_face_attr
+        uv_features, face_idx = self.rasterizer.rasterize(dims[1], dims[0], views.face_vertices_camera[:, :, :, -1],
+            views.face_vertices_image, uv_face_attr_batch)
+        # Only cache results that do not take part in an autograd graph. The cache
+        # holds a reference to the UVs so their id cannot be reused while cached.
+        if not uv_face_attr.requires_grad and not views.face_vertices_image.requires_grad:
+            views.rasterized[key] = (uv_face_attr, uv_features, face_idx)
+        return uv_features, face_idx
+
+    def render_texture(
+        self, verts, faces, uv_face_attr, texture_map,
+        elev=None, azim=None, radius=None, look_at_height=0.0,
+        dims=None, white_background=False, lighting=False, lights=None,
+        tile=False, shader_style=False, views=None
+    ):
+        # Reuse the cached geometry if a view set is given. Otherwise, set up the views
+        # from the camera parameters.
+        if views is None:
+            views = self.prepare_views(verts, faces, elev, azim, radius, look_at_height)
 
-        uv_features, face_idx = kal.render.mesh.rasterize(dims[1], dims[0], face_vertices_camera[:, :, :, -1],
-            face_vertices_image, uv_face_attr.repeat(B, 1, 1, 1))
+        dims = self.dim if dims is None else dims
+        B = len(views)
+        lights = self.lights.repeat(B, 1) if lights is None else lights
+        face_normals = views.face_normals
+
+        uv_features, face_idx = self.rasterize_views(views, uv_face_attr, dims)
         # uv_features = uv_features.detach()
 
         mask = (face_idx > -1).float()[..., None]
@@ -92,19 +176,20 @@ class Renderer:
             if tile:
                 # mod the UVs to tile the texture
                 uv_features = torch.remainder(uv_features, 1.0)
-            image_features = kal.render.mesh.texture_mapping(uv_features, texture_map.repeat(B, 1, 1, 1), mode=self.interpolation_mode)
+            # A batch of textures (one per view) is used as is
+            if texture_map.dim() < 4 or texture_map.shape[0] != B:
+                texture_map = texture_map.repeat(B, 1, 1, 1)
+            image_features = self.rasterizer.texture_mapping(uv_features, texture_map, mode=self.interpolation_mode)
         image_features = image_features * mask
 
         if lighting:
             image_features = torch.clamp(image_features, 0.0, 1.0)
-            # image_normals = face_normals[:, face_idx]#.squeeze(0) # TODO: might need to fix this when add lighting back
-            # TODO: batch normals
-            image_normals = []
-            for i in range(len(face_normals)):
-                image_normals.append(face_normals[i, face_idx[i], :])
-            image_normals = torch.stack(image_normals)
-            image_lighting = kal.render.mesh.spherical_harmonic_lighting(image_normals, lights)#.unsqueeze(0)
-            image_features = image_features * image_lighting.unsqueeze(-1).repeat(1, 1, 1, 3)
+            # Gather the normal of the visible face of every pixel in all views at once.
+            # Background pixels (face id -1) get a zero normal instead of the last face's.
+            batch_idx = torch.arange(B, device=face_idx.device).view(B, 1, 1)
+            image_normals = face_normals[batch_idx, face_idx.long().clamp(min=0)] * mask
+            image_lighting = self.rasterizer.spherical_harmonic_lighting(image_normals, lights)
+            image_features = image_features * image_lighting.unsqueeze(-1)
             image_features = torch.clamp(image_features, 0.0, 1.0)
 
         if white_background:
@@ -114,3 +199,32 @@ class Renderer:
         pred_mask = mask.permute(0, 3, 1, 2)
         final_image = (pred_features * pred_mask) + (1 * (1 - pred_mask))
         return final_image
+
+
+def pad_faces(face_attr, num_faces):
+    """
+    Pad per-face attributes (B x F x ...) with zeros to `num_faces` faces. Zero padded
+    face vertices form degenerate triangles that cover no pixels.
+    """
+    padding = num_faces - face_attr.shape[1]
+    if padding == 0:
+        return face_attr
+    zeros = torch.zeros((face_attr.shape[0], padding) + face_attr.shape[2:], dtype=face_attr.dtype, device=face_attr.device)
+    return torch.cat((face_attr, zeros), dim=1)
+
+
+class ViewSet:
+    """
+    Geometry of a mesh seen from a fixed set of cameras, created with
+    `Renderer.prepare_views()`. Holds the camera transforms and projected face vertices,
+    plus the rasterized UVs of every UV set rendered with these views so far.
+    """
+    def __init__(self, camera_transform, face_vertices_camera, face_vertices_image, face_normals):
+        self.camera_transform = camera_transform
+        self.face_vertices_camera = face_vertices_camera
+        self.face_vertices_image = face_vertices_image
+        self.face_normals = face_normals
+        self.rasterized = {}
+
+    def __len__(self):
+        return self.camera_transform.shape[0]
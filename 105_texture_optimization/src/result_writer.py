@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+import torch
+import torchvision
+
+
+class ResultWriter:
+    """ Save intermediate images of an optimization on a background thread
+
+    `save_image()` only takes a detached CPU copy of the tensor on the calling thread.
+    The PNG encoding (and, on the GPU, waiting for the copy to finish) happens on a
+    worker thread, so logging does not stall the optimization loop. If the worker
+    falls behind and the queue is full, new snapshots are dropped instead of waiting.
+    If writing an image fails, the worker stops and the error is raised again on the
+    calling thread by the next `save_image()` or by `close()`.
+
+    Args:
+        max_queue_size (int): maximum number of snapshots waiting to be written
+        frame_budget (float): optional time in seconds the calling thread may spend per
+            `save_image()` call. While the average cost of taking a snapshot is above
+            this budget, snapshots are dropped.
+        asynchronous (bool): if False, images are written immediately on the calling
+            thread (same behavior as calling `torchvision.utils.save_image()`)
+    """
+    def __init__(self, max_queue_size=8, frame_budget=None, asynchronous=True):
+        self.frame_budget = frame_budget
+        self.asynchronous = asynchronous
+        self.num_written = 0
+        self.num_dropped = 0
+        self._cost = 0.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = None
+        self._error = None
+        if asynchronous:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def save_image(self, tensor, path):
+        """ Queue a tensor to be saved as an image
+
+        Args:
+            tensor (torch.Tensor): image tensor (any shape accepted by
+                `torchvision.utils.save_image()`)
+            path (str): path of the output image
+
+        Returns:
+            bool: True if the snapshot was accepted, False if it was dropped
+        """
+        if not self.asynchronous:
+            torchvision.utils.save_image(tensor.detach(), path)
+            self.num_written += 1
+            return True
+        self._raise_worker_error()
+
+        # Skip the snapshot if taking it would go over the frame budget. The cost
+        # estimate decays on every skip so that we eventually try again.
+        if self.frame_budget is not None and self._cost > self.frame_budget:
+            self._cost *= 0.5
+            self.num_dropped += 1
+            return False
+        if self._queue.full():
+            self.num_dropped += 1
+            return False
+
+        start = time.perf_counter()
+        snapshot, event = self._copy_to_cpu(tensor)
+        try:
+            self._queue.put_nowait((snapshot, event, path))
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+        cost = time.perf_counter() - start
+        self._cost = cost if self._cost == 0.0 else 0.9 * self._cost + 0.1 * cost
+        return True
+
+    def close(self):
+        """ Write all pending snapshots and stop the worker thread """
+        if self._worker is None:
+            return
+        # A worker that died on an error no longer empties the queue, so only wait for
+        # room in the queue while it is running
+        while self._worker.is_alive():
+            try:
+                self._queue.put((None, None, None), timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._worker.join()
+        self._worker = None
+        self._raise_worker_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _copy_to_cpu(tensor):
+        tensor = tensor.detach()
+        if tensor.device.type != "cuda":
+            return tensor.clone(), None
+        # Copy into pinned memory without synchronizing. The worker waits on the event
+        # before reading the copy.
+        snapshot = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+        snapshot.copy_(tensor, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record()
+        return snapshot, event
+
+    def _raise_worker_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing an intermediate result failed") from error
+
+    def _run(self):
+        try:
+            while True:
+                snapshot, event, path = self._queue.get()
+                if path is None:
+                    break
+                if event is not None:
+                    event.synchronize()
+                torchvision.utils.save_image(snapshot, path)
+                self.num_written += 1
+        except Exception as error:
+            self._error = error
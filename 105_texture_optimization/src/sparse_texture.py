@@ -0,0 +1,91 @@
+import torch
+
+from .bake_texture_map import bake_texture_image
+from .checkpoint import atomic_save
+
+def compact_texels(surface_points, texel_indices):
+    """ Keep a single surface point per covered texel
+
+    Texels near triangle edges can be covered by more than one triangle (see the
+    tolerance of `inverse_map()`). Only the first surface point of each texel is kept
+    and the texels are sorted, so predictions and writes scale with the covered area.
+
+    Args:
+        surface_points (torch.Tensor): N x 3 surface points
+        texel_indices (torch.Tensor): N texel indices
+
+    Returns:
+        surface_points (torch.Tensor): U x 3 surface points of the U covered texels
+        texel_indices (torch.Tensor): U sorted, unique texel indices
+    """
+    texel_indices, inverse = torch.unique(texel_indices, return_inverse=True)
+    points = torch.arange(inverse.shape[0], device=inverse.device)
+    first = torch.full_like(texel_indices, inverse.shape[0]).scatter_reduce(0, inverse, points, reduce='amin')
+    return surface_points[first], texel_indices
+
+def _to_texel_order(texture_image):
+    # Inverse of the orientation of baked textures, see `SparseTexture.to_dense()`
+    channels = texture_image.shape[1]
+    return texture_image[0].flip(1).transpose(1, 2).reshape(channels, -1).T
+
+class SparseTexture:
+    """
+    Texture image that only stores the texels covered by the UV charts. The values are
+    kept per texel index (in the order of `get_texels()`) and are expanded to a dense
+    image only when it is needed for sampling.
+
+    Args:
+        texel_indices (torch.Tensor): N unique texel indices
+        values (torch.Tensor): N x C texel values
+        size (tuple): (H, W) size of the dense texture image
+    """
+    def __init__(self, texel_indices, values, size):
+        self.texel_indices = texel_indices.long()
+        self.values = values
+        self.size = tuple(size)
+
+    @staticmethod
+    def from_dense(texture_image, texel_indices):
+        """ Keep the covered texels of a 1 x C x H x W texture image """
+        texel_indices = torch.unique(texel_indices)
+        values = _to_texel_order(texture_image)[texel_indices]
+        return SparseTexture(texel_indices, values, texture_image.shape[2:])
+
+    @property
+    def coverage(self):
+        """ Fraction of the texels that are covered """
+        return self.texel_indices.shape[0] / (self.size[0] * self.size[1])
+
+    def to_dense(self, background=None):
+        """ Expand to a dense texture image
+
+        Args:
+            background (torch.Tensor): optional (H*W) x C values of the uncovered texels
+                in texel order (zero if None)
+
+        Returns:
+            torch.Tensor: 1 x C x H x W texture image
+        """
+        H, W = self.size
+        channels = self.values.shape[1]
+        if background is None:
+            background = torch.zeros(H * W, channels, dtype=self.values.dtype, device=self.values.device)
+        flat_texture = bake_texture_image(self.values, self.texel_indices, background)
+        return flat_texture.T.reshape(1, channels, H, W).transpose(2, 3).flip(2)
+
+    def coverage_mask(self):
+        """ 1 x 1 x H x W mask of the covered texels """
+        ones = torch.ones(self.values.shape[0], 1, device=self.values.device)
+        return SparseTexture(self.texel_indices, ones, self.size).to_dense()
+
+    def save(self, path):
+        atomic_save({
+            "texel_indices": self.texel_indices.int().cpu(),
+            "values": self.values.detach().cpu(),
+            "size": self.size,
+        }, path)
+
+    @staticmethod
+    def load(path, device):
+        data = torch.load(path, map_location=device)
+        return SparseTexture(data["texel_indices"], data["values"], data["size"])
@@ -1,7 +1,10 @@
+import re
 import torch
 import torchvision
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.tri import Triangulation
+from PIL import Image
 
 def load_texture_image(path, device):
     # Load image
@@ -56,25 +59,198 @@ def plot_uvs(savefile, vt, ft, img,
     plt.axis('off')
     axs.axis('equal')
     plt.savefig(savefile)
+    plt.close(fig)
+
+# save_uv_overlay() and rasterize_uv_edges() are the same as in 104_texture_maps/src/utils.py
+# (like plot_uvs()): every module folder runs on its own, so keep both copies in sync
+def save_uv_overlay(savefile, vt, ft, img=None, resolution=1024, linewidth=1, color=(0, 0, 0),
+                    xmin=0, xmax=1, ymin=0, ymax=1, max_samples=1 << 22):
+    """ Draw the UV triangle edges over a texture image and save it as a PNG
+
+    Unlike `plot_uvs()`, the edges are rasterized directly into an image at the
+    resolution of the texture (see `rasterize_uv_edges()`), so large atlases are drawn
+    quickly and with bounded memory.
+
+    Args:
+        savefile (str): the path to save the image
+        vt (torch.tensor): V x 2 array of UV coordinates
+        ft (torch.tensor): F x 3 integer array of face indices
+        img (np.ndarray): H x W x C texture image with values in [0, 1] (or uint8), or
+            None for a white background
+        resolution (int): size of the image if img is None
+        linewidth (int): the width of the triangle edges in pixels
+        color (tuple): RGB color of the edges, integers in [0, 255]
+        xmin (float): the minimum x value of the image
+        xmax (float): the maximum x value of the image
+        ymin (float): the minimum y value of the image
+        ymax (float): the maximum y value of the image
+        max_samples (int): maximum number of edge samples rasterized at once
+
+    Returns:
+        image (np.ndarray): H x W x 3 uint8 image
+    """
+    if img is None:
+        image = np.full((resolution, resolution, 3), 255, dtype=np.uint8)
+    else:
+        img = np.asarray(img)
+        if img.dtype != np.uint8:
+            img = np.clip(np.rint(img * 255), 0, 255).astype(np.uint8)
+        image = np.repeat(img[..., None], 3, axis=2) if img.ndim == 2 else img[..., :3].copy()
+
+    mask = rasterize_uv_edges(vt, ft, image.shape[0], image.shape[1],
+                              xmin, xmax, ymin, ymax, max_samples=max_samples)
+    # Thicken the lines by taking the maximum over a linewidth x linewidth window
+    lo, hi = -((linewidth - 1) // 2), linewidth // 2
+    thick = np.zeros_like(mask)
+    for dy in range(lo, hi + 1):
+        for dx in range(lo, hi + 1):
+            thick[max(dy, 0):mask.shape[0] + min(dy, 0), max(dx, 0):mask.shape[1] + min(dx, 0)] |= \
+                mask[max(-dy, 0):mask.shape[0] + min(-dy, 0), max(-dx, 0):mask.shape[1] + min(-dx, 0)]
+    image[thick] = color
+    Image.fromarray(image).save(savefile)
+    return image
+
+def rasterize_uv_edges(vt, ft, height, width, xmin=0, xmax=1, ymin=0, ymax=1, max_samples=1 << 22):
+    """ Rasterize the edges of UV triangles into a boolean image
+
+    Every unique edge is clipped to the image and sampled once per pixel along its major
+    axis (a vectorized DDA line rasterizer). The samples of all edges are generated at
+    once, in chunks of at most `max_samples` samples. Row 0 of the image is at v = ymax,
+    as with `imshow(origin='upper')`.
+
+    Args:
+        vt (torch.tensor): V x 2 array of UV coordinates
+        ft (torch.tensor): F x 3 integer array of face indices
+        height (int): number of image rows
+        width (int): number of image columns
+        xmin (float): u coordinate of the left border of the image
+        xmax (float): u coordinate of the right border of the image
+        ymin (float): v coordinate of the bottom border of the image
+        ymax (float): v coordinate of the top border of the image
+        max_samples (int): maximum number of edge samples rasterized at once
+
+    Returns:
+        mask (np.ndarray): height x width boolean array, True on the edges
+    """
+    vt = np.asarray(vt.detach().cpu() if hasattr(vt, "detach") else vt, dtype=np.float64)
+    ft = np.asarray(ft.detach().cpu() if hasattr(ft, "detach") else ft, dtype=np.int64)
+
+    # Unique edges, shared edges are drawn once
+    edges = np.sort(ft[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edges = np.unique(edges[:, 0] * vt.shape[0] + edges[:, 1])
+    edges = np.stack((edges // vt.shape[0], edges % vt.shape[0]), axis=1)
+
+    # Pixel coordinates, pixel (row, col) covers [col - 0.5, col + 0.5] x [row - 0.5, row + 0.5]
+    points = np.stack((
+        (vt[:, 0] - xmin) / (xmax - xmin) * width - 0.5,
+        (ymax - vt[:, 1]) / (ymax - ymin) * height - 0.5
+    ), axis=1)
+    start, direction = points[edges[:, 0]], points[edges[:, 1]] - points[edges[:, 0]]
+
+    # Clip the segments to the image (Liang-Barsky) so that edges far outside cost nothing
+    t0, t1 = np.zeros(len(edges)), np.ones(len(edges))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for axis, size in ((0, width), (1, height)):
+            for p, q in ((-direction[:, axis], start[:, axis] + 0.5),
+                         (direction[:, axis], size - 0.5 - start[:, axis])):
+                t = q / p
+                t0 = np.where(p < 0, np.maximum(t0, t), t0)
+                t1 = np.where(p > 0, np.minimum(t1, t), t1)
+                # Parallel to the border and outside of it
+                t1 = np.where((p == 0) & (q < 0), -1, t1)
+    visible = (t0 <= t1) & np.isfinite(start).all(axis=1) & np.isfinite(direction).all(axis=1)
+    start, direction = start[visible] + t0[visible, None] * direction[visible], \
+        (t1 - t0)[visible, None] * direction[visible]
+
+    mask = np.zeros((height, width), dtype=bool)
+    counts = np.ceil(np.abs(direction).max(axis=1)).astype(np.int64) + 1
+    ends = np.cumsum(counts)
+    chunk_starts = np.searchsorted(ends, np.arange(0, ends[-1] if len(ends) else 0, max_samples), side="right")
+    for first, last in zip(chunk_starts, np.append(chunk_starts[1:], len(counts))):
+        if first >= last:
+            continue
+        chunk_counts = counts[first:last]
+        edge = np.repeat(np.arange(first, last), chunk_counts)
+        step = np.arange(len(edge)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        t = step / np.maximum(chunk_counts - 1, 1)[edge - first]
+        samples = np.floor(start[edge] + t[:, None] * direction[edge] + 0.5).astype(np.int64)
+        cols = np.clip(samples[:, 0], 0, width - 1)
+        rows = np.clip(samples[:, 1], 0, height - 1)
+        mask[rows, cols] = True
+    return mask
+
+def load_obj(path):
+    """ Load the vertices, triangles and UVs of an OBJ file without kaolin
+
+    Args:
+        path (str): path of the OBJ file
+
+    Returns:
+        vertices (torch.tensor): V x 3 array of vertex positions
+        faces (torch.tensor): F x 3 array of vertex indices
+        vt (torch.tensor): T x 2 array of UV coordinates (None if the faces have no UVs)
+        ft (torch.tensor): F x 3 array of UV indices of the face corners (None if the
+            faces have no UVs)
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    v_lines = re.findall(rb"^v +([^\n]*)", content, re.M)
+    vt_lines = re.findall(rb"^vt +([^\n]*)", content, re.M)
+    f_lines = re.findall(rb"^f +([^\n]*)", content, re.M)
+
+    vertices = np.fromstring(b" ".join(v_lines), dtype=np.float32, sep=" ").reshape(len(v_lines), -1)[:, :3]
+    # Corners are "v", "v/vt", "v//vn" or "v/vt/vn"; missing UV indices become 0
+    corners = np.array([
+        (int(v), int(t or 0)) for v, t in re.findall(rb"(-?\d+)(?:/(-?\d*))?(?:/-?\d*)?", b" ".join(f_lines))
+    ], dtype=np.int64).reshape(len(f_lines), 3, 2)
+    # OBJ indices start at 1, negative indices count from the end
+    faces = np.where(corners[..., 0] > 0, corners[..., 0] - 1, corners[..., 0] + len(vertices))
+    vertices, faces = torch.from_numpy(vertices), torch.from_numpy(faces)
+    if len(vt_lines) == 0 or np.any(corners[..., 1] == 0):
+        return vertices, faces, None, None
+    vt = np.fromstring(b" ".join(vt_lines), dtype=np.float32, sep=" ").reshape(len(vt_lines), -1)[:, :2]
+    ft = np.where(corners[..., 1] > 0, corners[..., 1] - 1, corners[..., 1] + len(vt))
+    return vertices, faces, torch.from_numpy(vt), torch.from_numpy(ft)
 
 def load_uvs(path):
-    vt = []
-    uv = []
-    with open(path, "r") as f:
-        content = f.readlines()
-        if ".obj" in path:
-            for line in content:
-                elems = line.split(" ")
-                if elems[0] == "vt":
-                        vt.append([float(uv) for uv in elems[1:]])
-            for line in content:
-                elems = line.split(" ")
-                if elems[0] == "f":
-                    if "//" in elems[1]:
-                        pass
-                    elif "/" in elems[1]:
-                        for vert in elems[1:]:
-                            uv.append(vt[int(vert.split("/")[1]) - 1])
-    vt = torch.tensor(vt)
-    uvs = torch.tensor(uv)
-    return uvs, vt
\ No newline at end of file
+    """ Load the UV coordinates of the face corners of an OBJ file
+
+    The "vt" and "f" lines are extracted from the file content with regular
+    expressions. Their numbers are then parsed at once and the per-corner UVs are
+    gathered with a single indexing operation.
+
+    Args:
+        path (str): path of the OBJ file
+
+    Returns:
+        uvs (torch.tensor): N x 2 array of UV coordinates of the N face corners
+        vt (torch.tensor): T x 2 array of UV coordinates
+    """
+    vt_lines = []
+    f_lines = []
+    if ".obj" in path:
+        with open(path, "rb") as f:
+            content = f.read()
+        vt_lines = re.findall(rb"^vt +([^\n]*)", content, re.M)
+        # Only faces with UV indices ("v/vt" or "v/vt/vn", but not "v//vn")
+        f_lines = re.findall(rb"^f +([^/\s]*/[^/\s][^\n]*)", content, re.M)
+    if len(vt_lines) == 0:
+        return torch.zeros(0, 2), torch.zeros(0, 2)
+
+    vt = np.fromstring(b" ".join(vt_lines), dtype=np.float32, sep=" ").reshape(len(vt_lines), -1)[:, :2]
+    uv_idx = _parse_uv_indices(b" ".join(f_lines))
+    # OBJ indices start at 1, negative indices count from the end
+    uv_idx = np.where(uv_idx > 0, uv_idx - 1, uv_idx + len(vt))
+    uvs = vt[uv_idx]
+    return torch.from_numpy(uvs), torch.from_numpy(vt)
+
+def _parse_uv_indices(corners):
+    # Corners are "v/vt" or "v/vt/vn". If all corners have the same format, all indices
+    # are parsed as one flat integer array and every k-th one is a UV index.
+    num_fields = corners.split(b" ", 1)[0].count(b"/") + 1
+    indices = np.fromstring(corners.replace(b"/", b" "), dtype=np.int64, sep=" ")
+    num_corners = len(indices) // num_fields
+    if len(indices) == num_corners * num_fields and corners.count(b"/") == num_corners * (num_fields - 1):
+        return indices[1::num_fields]
+    # Mixed formats: the UV index is the number after the first slash of every corner
+    return np.array(re.findall(rb"-?\d+/(-?\d+)", corners), dtype=np.int64)
@@ -0,0 +1,70 @@
+import torch
+
+def sample_uniform_views(num_renders, device):
+    """ Sample random camera parameters (angles in radians)
+
+    Returns:
+        azim (torch.Tensor): azimuths in [0, 2pi)
+        elev (torch.Tensor): elevations in [-pi/2, pi/2)
+    """
+    azim = torch.deg2rad(torch.rand((num_renders,), device=device) * 360)
+    elev = torch.deg2rad(torch.rand((num_renders,), device=device) * 180 - 90)
+    return azim, elev
+
+class ImportanceViewSampler:
+    """
+    Sample camera directions more often where the recent render error was high. The
+    directions are split into azimuth x elevation bins. Every bin keeps an exponential
+    moving average of the per-view loss of the views sampled in it. A bin is drawn with
+    a probability proportional to its error, mixed with a uniform distribution so that
+    every direction keeps being visited, and the view is drawn uniformly inside the bin.
+
+    Args:
+        azim_bins (int): number of azimuth bins
+        elev_bins (int): number of elevation bins
+        decay (float): weight of the previous error in the moving average
+        uniform_weight (float): weight of the uniform distribution in the mixture
+    """
+    def __init__(self, azim_bins=8, elev_bins=4, decay=0.9, uniform_weight=0.25):
+        self.azim_bins = azim_bins
+        self.elev_bins = elev_bins
+        self.decay = decay
+        self.uniform_weight = uniform_weight
+        self.errors = None
+
+    def sample(self, num_renders, device):
+        """ Sample camera directions
+
+        Returns:
+            azim (torch.Tensor): azimuths in radians
+            elev (torch.Tensor): elevations in radians
+            bins (torch.Tensor): bin of every view, to pass to `update()`
+        """
+        num_bins = self.azim_bins * self.elev_bins
+        if self.errors is None:
+            probabilities = torch.full((num_bins,), 1 / num_bins)
+        else:
+            probabilities = self.uniform_weight / num_bins + \
+                (1 - self.uniform_weight) * self.errors / self.errors.sum().clamp(min=1e-12)
+        bins = torch.multinomial(probabilities, num_renders, replacement=True).to(device)
+
+        azim = (bins % self.azim_bins + torch.rand((num_renders,), device=device)) * (360 / self.azim_bins)
+        elev = (bins // self.azim_bins + torch.rand((num_renders,), device=device)) * (180 / self.elev_bins) - 90
+        return torch.deg2rad(azim), torch.deg2rad(elev), bins
+
+    def update(self, bins, errors):
+        """ Update the error of the bins with the per-view losses of sampled views """
+        bins, errors = bins.cpu(), errors.detach().float().cpu()
+        if self.errors is None:
+            # Unvisited bins start with the first error seen, so they are not ignored
+            self.errors = torch.full((self.azim_bins * self.elev_bins,), errors.mean().item())
+        for view_bin, error in zip(bins.tolist(), errors.tolist()):
+            self.errors[view_bin] = self.decay * self.errors[view_bin] + (1 - self.decay) * error
+
+    def state_dict(self):
+        """ State of the sampler, to save it in a checkpoint """
+        return {"errors": None if self.errors is None else self.errors.clone()}
+
+    def load_state_dict(self, state):
+        """ Restore the state saved by `state_dict()` """
+        self.errors = None if state["errors"] is None else state["errors"].cpu()